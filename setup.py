@@ -59,7 +59,7 @@ setup(
     packages=find_namespace_packages(where="src"),
     package_data={
         "grid.data": ["*.*"],
-        "grid.data.lebedev": ["*.npz"],
+        "grid.data.lebedev": ["*.npy"],
     },
     zip_safe=False,
     install_requires=[
@@ -1,9 +1,128 @@
 """Module for generating Atomic Grid."""
+import threading
+
 from grid.basegrid import Grid
+from grid.interpolate import generate_real_sph_harms, lm_pairs, project_sph_harms
 from grid.lebedev import generate_lebedev_grid, match_degree
+from grid.utils import LRUCache, get_cov_radii
 
 import numpy as np
 
+from scipy.interpolate import CubicSpline
+
+# process-wide LRU cache of centred atomic grids, keyed by the radial grid,
+# atomic radius, scales and degs
+_template_cache = LRUCache(maxsize=128)
+# (azimuthal, polar) angles of the unit sphere points of each lebedev degree
+_sphere_angles = {}
+_sphere_angles_lock = threading.Lock()
+
+
+def atomic_grid_cache_info():
+    """Get statistics of the atomic grid template cache.
+
+    Returns
+    -------
+    CacheInfo
+        Named tuple of hits, misses, maxsize and currsize of the cache
+    """
+    return _template_cache.info()
+
+
+def clear_atomic_grid_cache():
+    """Remove all templates from the atomic grid cache and reset its statistics."""
+    _template_cache.clear()
+
+
+def resize_atomic_grid_cache(maxsize):
+    """Set the largest number of templates kept in the atomic grid cache.
+
+    Least recently used templates beyond maxsize are removed.
+
+    Parameters
+    ----------
+    maxsize : int or None
+        Largest number of cached templates. If None, the cache is unbounded,
+        if 0, no template is cached.
+
+    Raises
+    ------
+    ValueError
+        maxsize is negative
+    """
+    _template_cache.resize(maxsize)
+
+
+# pruned grid presets: angular degree of each region and region boundaries,
+# in units of the atomic radius, for elements of rows 1, 2 and 3. "sg1" is the
+# SG-1 grid of Gill, Johnson and Pople, Chem. Phys. Lett. 209, 506 (1993),
+# which is only defined for H to Ar. The "sg1-d<L>" presets are not published
+# grids: they keep the SG-1 regions and raise the Lebedev degree of each region,
+# most in the valence region, up to degree L, as a ladder of denser grids for
+# convergence checks. They are not the per-element tuned "coarse" to "insane"
+# grids of old_grid (tv-13.7-*.txt), which also choose the radial grid.
+_sg1_scales = [[0.25, 0.5, 1.0, 4.5], [0.1667, 0.5, 0.9, 3.5], [0.1, 0.4, 0.8, 2.5]]
+_pruning_presets = {
+    "sg1": {"degs": [3, 9, 15, 23, 15], "scales": _sg1_scales},
+    "sg1-d29": {"degs": [5, 11, 19, 29, 19], "scales": _sg1_scales},
+    "sg1-d35": {"degs": [7, 15, 23, 35, 23], "scales": _sg1_scales},
+    "sg1-d41": {"degs": [9, 19, 29, 41, 29], "scales": _sg1_scales},
+    "sg1-d53": {"degs": [11, 23, 35, 53, 35], "scales": _sg1_scales},
+}
+# last atomic number of each row with SG-1 regions
+_pruning_rows = [2, 10, 18]
+
+
+def get_pruning_params(atnum, preset="sg1", rad_type="bragg"):
+    """Get the atomic radius, scales and degs of a pruned grid preset.
+
+    All presets use the SG-1 pruning regions, which are only defined for the
+    elements H to Ar. "sg1" has the SG-1 angular degrees. "sg1-d29",
+    "sg1-d35", "sg1-d41" and "sg1-d53" have denser angular grids in the same
+    regions, with the largest degree in their name; they are not taken from
+    the literature.
+
+    Parameters
+    ----------
+    atnum : int
+        Atomic number of the element
+    preset : str, default to "sg1"
+        Name of the pruning preset, one of "sg1", "sg1-d29", "sg1-d35",
+        "sg1-d41" and "sg1-d53"
+    rad_type : str, default to "bragg"
+        Type of covalent radii the region boundaries are scaled with, see
+        grid.utils.get_cov_radii. Elements without Bragg radius (noble gases)
+        use the Cambridge radius.
+
+    Returns
+    -------
+    tuple(float, np.ndarray(4,), np.ndarray(5,))
+        Atomic radius, scales and degs for AtomicGrid
+
+    Raises
+    ------
+    ValueError
+        Unknown preset, element beyond Ar, or no radius for given element
+    """
+    if preset not in _pruning_presets:
+        raise ValueError(
+            f"Unknown pruning preset {preset}, "
+            f"choose from {', '.join(_pruning_presets)}"
+        )
+    if not 1 <= atnum <= _pruning_rows[-1]:
+        raise ValueError(
+            f"Pruning presets are only defined for atomic numbers 1 to "
+            f"{_pruning_rows[-1]}, got {atnum}"
+        )
+    atomic_rad = get_cov_radii(atnum, rad_type)[0]
+    if np.isnan(atomic_rad) and rad_type == "bragg":
+        atomic_rad = get_cov_radii(atnum, "cambridge")[0]
+    if np.isnan(atomic_rad):
+        raise ValueError(f"No {rad_type} radius for atomic number {atnum}")
+    row = np.searchsorted(_pruning_rows, atnum)
+    params = _pruning_presets[preset]
+    return atomic_rad, np.array(params["scales"][row]), np.array(params["degs"])
+
 
 class AtomicGrid(Grid):
     """Atomic grid construction class."""
@@ -60,21 +179,89 @@ class AtomicGrid(Grid):
         # assign stage
         self._center = center
         self._radial_grid = radial_grid
-        # initiate atomic grid property as None
-        rad_degs = self._find_l_for_rad_list(
-            self._radial_grid.points, atomic_rad, scales, degs
-        )
-        # set real degree to each rad point
-        self._rad_degs = match_degree(rad_degs)
-        self._points, self._weights, self._indices = self._generate_atomic_grid(
-            self._radial_grid, self._rad_degs, center
-        )
+        (
+            self._rad_degs,
+            self._points,
+            self._weights,
+            self._indices,
+        ) = self._load_template(radial_grid, atomic_rad, scales, degs)
         self._size = len(self._weights)
+        # translated points, computed on first access for _points_center
+        self._moved_points = None
+        self._points_center = None
+        # cached spherical harmonics projectors of each l_max
+        self._projectors = {}
+
+    @classmethod
+    def from_preset(
+        cls,
+        radial_grid,
+        atnum,
+        preset="sg1",
+        *,
+        rad_type="bragg",
+        center=np.array([0.0, 0.0, 0.0]),
+    ):
+        """Construct pruned atomic grid of an element from a named preset.
+
+        The angular grid of each radial shell is chosen by the region of the
+        shell, see get_pruning_params. SG-1 is defined with a 50-point
+        Euler-Maclaurin radial grid for the elements H to Ar.
+
+        Parameters
+        ----------
+        radial_grid : Grid
+            Radial grid for each unit spherical shell
+        atnum : int
+            Atomic number of the element
+        preset : str, default to "sg1"
+            Name of the pruning preset
+        rad_type : str, default to "bragg", keyword-only argument
+            Type of covalent radii the region boundaries are scaled with
+        center : np.ndarray(3,), default to [0., 0., 0.], keyword-only argument
+            Central cartesian coordinates of atomic grid
+
+        Returns
+        -------
+        AtomicGrid
+            Pruned atomic grid
+        """
+        atomic_rad, scales, degs = get_pruning_params(atnum, preset, rad_type)
+        return cls(radial_grid, atomic_rad, scales=scales, degs=degs, center=center)
 
     @property
     def points(self):
-        """np.npdarray(N, 3): cartesian coordinates of points in grid."""
-        return self._points + self._center
+        """np.npdarray(N, 3): cartesian coordinates of points in grid (read-only)."""
+        if self._moved_points is None or not np.array_equal(
+            self._points_center, self._center
+        ):
+            self._moved_points = self._points + self._center
+            self._moved_points.flags.writeable = False
+            self._points_center = np.array(self._center, dtype=float)
+        return self._moved_points
+
+    def get_points(self, out=None):
+        """Compute cartesian coordinates of points in grid.
+
+        Parameters
+        ----------
+        out : np.ndarray(N, 3), optional
+            Array to store the coordinates in, e.g. a slice of the points of a
+            molecular grid. If None, the cached points are returned.
+
+        Returns
+        -------
+        np.ndarray(N, 3)
+            Cartesian coordinates of points in grid
+        """
+        if out is None:
+            return self.points
+        if self._moved_points is not None and np.array_equal(
+            self._points_center, self._center
+        ):
+            out[...] = self._moved_points
+            return out
+        return np.add(self._points, self._center, out=out)
 
     @property
     def indices(self):
@@ -87,11 +274,77 @@ class AtomicGrid(Grid):
         """np.ndarray(3,): Center of atomic grid."""
         return self._center
 
+    @center.setter
+    def center(self, value):
+        """Move the atomic grid to a new center."""
+        if not isinstance(value, np.ndarray):
+            raise TypeError(
+                f"Center should be a numpy array with 3 entries, got {type(value)}."
+            )
+        if len(value) != 3:
+            raise ValueError(f"Center should only have 3 entries, got {len(value)}.")
+        self._center = value
+
     @property
     def l_max(self):
         """int: Largest angular degree L value in angular grids."""
         return np.max(self._rad_degs)
 
+    def integrate_shells(self, values):
+        """Integrate functions over each spherical shell of the grid.
+
+        Parameters
+        ----------
+        values : np.ndarray(N,) or np.ndarray(K, N)
+            Values of one or K functions on the grid points
+
+        Returns
+        -------
+        np.ndarray(M,) or np.ndarray(K, M)
+            Integral of each function over each of the M spherical shells,
+            including the radial weights
+        """
+        values = np.asarray(values)
+        if values.shape[-1] != self.size:
+            raise ValueError(
+                f"Values need to have {self.size} points, got shape {values.shape}."
+            )
+        return np.add.reduceat(values * self._weights, self._indices[:-1], axis=-1)
+
+    def get_spherical_average(self, values, grads=None):
+        """Compute spherical averages of functions on each radial point.
+
+        Parameters
+        ----------
+        values : np.ndarray(N,) or np.ndarray(K, N)
+            Values of one or K functions on the grid points
+        grads : np.ndarray(N, 3) or np.ndarray(K, N, 3), optional
+            Gradients of the functions on the grid points. When given, the
+            radial derivatives of the spherical averages are also computed.
+
+        Returns
+        -------
+        np.ndarray(M,) or np.ndarray(K, M)
+            Spherical average of each function on each of the M radial points.
+            If grads is given, a tuple of the spherical averages and their
+            radial derivatives.
+        """
+        shell_weights = np.add.reduceat(self._weights, self._indices[:-1])
+        average = self.integrate_shells(values) / shell_weights
+        if grads is None:
+            return average
+        grads = np.asarray(grads)
+        if grads.shape != np.shape(values) + (3,):
+            raise ValueError(
+                f"Gradients need to have shape {np.shape(values) + (3,)}, "
+                f"got {grads.shape}."
+            )
+        # radial derivative is the gradient along (r - center) / r
+        rad_grads = np.einsum("...j,...j->...", grads, self._points)
+        deriv = self.integrate_shells(rad_grads)
+        deriv /= shell_weights * self._radial_grid.points
+        return average, deriv
+
     def convert_cart_to_sph(self):
         """Compute spherical coordinates of the grid.
 
@@ -100,12 +353,154 @@ class AtomicGrid(Grid):
         np.ndarray(N, 3):
             [azimuthal angle(0, 2pi), polar angle(0, pi), radii]
         """
-        r = np.linalg.norm(self._points, axis=1)
-        # polar angle: arccos(z / r)
-        phi = np.arccos(self._points[:, 2] / r)
-        # azimuthal angle arctan2(y / x)
-        theta = np.arctan2(self._points[:, 1], self._points[:, 0])
-        return np.vstack([theta, phi, r]).T
+        sph_coors = np.empty((3, self.size))
+        sph_coors[2] = np.repeat(self._radial_grid.points, np.diff(self._indices))
+        # consecutive shells of one degree share the angles of the unit sphere
+        bounds = np.nonzero(np.diff(self._rad_degs))[0] + 1
+        bounds = np.concatenate([[0], bounds, [len(self._rad_degs)]])
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            angles = self._get_sphere_angles(self._rad_degs[start])
+            block = sph_coors[:2, self._indices[start] : self._indices[end]]
+            block.reshape(2, end - start, -1)[...] = angles.T[:, None]
+        return sph_coors.T
+
+    def get_sph_harm_projector(self, l_max, *, cache=False):
+        """Compute real spherical harmonics times weights on the grid points.
+
+        The spherical harmonics are computed once for each lebedev degree and
+        shared by all shells of that degree.
+
+        Parameters
+        ----------
+        l_max : int
+            Largest angular degree of spherical harmonics
+        cache : bool, default to False, keyword-only argument
+            Keep the projector on the atomic grid for later calls
+
+        Returns
+        -------
+        np.ndarray((l_max + 1) ** 2, N)
+            Weighted real spherical harmonics, see
+            grid.interpolate.generate_real_sph_harms for the layout
+        """
+        if l_max in self._projectors:
+            return self._projectors[l_max]
+        projector = np.empty(((l_max + 1) ** 2, self.size))
+        bounds = np.nonzero(np.diff(self._rad_degs))[0] + 1
+        bounds = np.concatenate([[0], bounds, [len(self._rad_degs)]])
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            angles = self._get_sphere_angles(self._rad_degs[start])
+            sph_harm = generate_real_sph_harms(l_max, angles[:, 0], angles[:, 1])
+            block = projector[:, self._indices[start] : self._indices[end]]
+            block.reshape(len(projector), end - start, -1)[...] = sph_harm[:, None]
+        projector *= self._weights
+        if cache:
+            projector.flags.writeable = False
+            self._projectors[l_max] = projector
+        return projector
+
+    def spline_with_sph_harms(self, value_arrays, l_max=None, *, cache=False):
+        """Compute radial splines of real spherical harmonics expansion.
+
+        Coefficients with l larger than half of the angular degree of their
+        shell are not resolved by the shell and are set to zero.
+
+        Parameters
+        ----------
+        value_arrays : np.ndarray(N,) or np.ndarray(K, N)
+            Values of one or K functions on the grid points
+        l_max : int, optional
+            Largest angular degree of expansion, default to half of the
+            largest angular degree of the shells
+        cache : bool, default to False, keyword-only argument
+            Keep the spherical harmonics projector on the atomic grid for
+            later calls
+
+        Returns
+        -------
+        scipy.CubicSpline
+            Spline of the expansion coefficients of shape (L,) or (K, L) on
+            each radial point, see grid.interpolate.spline_with_sph_harms
+        """
+        if l_max is None:
+            l_max = self.l_max // 2
+        projector = self.get_sph_harm_projector(l_max, cache=cache)
+        ml_sph_value = project_sph_harms(projector, value_arrays, self._indices)
+        shells, lms = np.nonzero(lm_pairs(l_max)[0] > self._rad_degs[:, None] // 2)
+        ml_sph_value[shells, ..., lms] = 0
+        return CubicSpline(x=self._radial_grid.points, y=ml_sph_value)
+
+    @staticmethod
+    def _get_sphere_angles(degree):
+        """Get the angles of the unit sphere lebedev grid of given degree.
+
+        Parameters
+        ----------
+        degree : int
+            Degree of lebedev grid
+
+        Returns
+        -------
+        np.ndarray(N, 2)
+            [azimuthal angle(0, 2pi), polar angle(0, pi)] of each point,
+            read-only and cached for each degree
+        """
+        with _sphere_angles_lock:
+            if degree in _sphere_angles:
+                return _sphere_angles[degree]
+        points = generate_lebedev_grid(degree=degree).points
+        r = np.linalg.norm(points, axis=1)
+        # azimuthal angle arctan2(y / x), polar angle: arccos(z / r)
+        angles = np.stack(
+            [np.arctan2(points[:, 1], points[:, 0]), np.arccos(points[:, 2] / r)],
+            axis=1,
+        )
+        angles.flags.writeable = False
+        with _sphere_angles_lock:
+            return _sphere_angles.setdefault(degree, angles)
+
+    @staticmethod
+    def _load_template(radial_grid, atomic_rad, scales, degs):
+        """Get centred atomic grid arrays through the atomic grid template cache.
+
+        Atomic grids with the same radial grid, atomic radius, scales and degs
+        (e.g. of the same element) share the same read-only arrays.
+
+        Parameters
+        ----------
+        radial_grid : Grid
+        atomic_rad : float
+        scales : np.ndarray(K,)
+        degs : np.ndarray(K+1,)
+
+        Returns
+        -------
+        tuple(np.ndarray(N,), np.ndarray(M, 3), np.ndarray(M,), np.ndarray(N+1,)),
+        degree of each radial point and points (centred at origin), weights
+        and shell indices of atomic grid.
+        """
+        key = (
+            radial_grid.points.tobytes(),
+            radial_grid.weights.tobytes(),
+            float(atomic_rad),
+            tuple(np.ravel(scales).tolist()),
+            tuple(np.ravel(degs).tolist()),
+        )
+
+        def generate():
+            rad_degs = AtomicGrid._find_l_for_rad_list(
+                radial_grid.points, atomic_rad, scales, degs
+            )
+            # set real degree to each rad point
+            rad_degs = match_degree(rad_degs)
+            template = (rad_degs,) + AtomicGrid._generate_atomic_grid(
+                radial_grid, rad_degs
+            )
+            for array in template:
+                array.flags.writeable = False
+            return template
+
+        return _template_cache.get(key, generate)
 
     @staticmethod
     def _find_l_for_rad_list(radial_arrays, atomic_rad, scales, degs):
@@ -148,27 +543,12 @@ class AtomicGrid(Grid):
         return {i: generate_lebedev_grid(degree=i) for i in unique_degs}
 
     @staticmethod
-    def _generate_sphere_grid(one_pt_grid, angle_grid, rad_order=2):
-        """Generate spherical grid's points(coords) and weights.
-
-        Parameters
-        ----------
-        one_pt_grid : Grid
-        angle_grid : AngularGrid
-
-        Returns
-        -------
-        tuple(np.ndarra(N,), np.ndarray(N,)), spherical points and its weights.
-        """
-        return (
-            angle_grid.points * one_pt_grid.points,
-            angle_grid.weights * one_pt_grid.weights * one_pt_grid.points ** rad_order,
-        )
-
-    @staticmethod
-    def _generate_atomic_grid(rad_grid, degs, center):
+    def _generate_atomic_grid(rad_grid, degs):
         """Generate atomic grid for each radial point with given magic L.
 
+        Shells with the same degree are generated together by broadcasting
+        into preallocated arrays.
+
         Parameters
         ----------
         rad_grid : Grid, radial grid of given atomic grid.
@@ -176,24 +556,23 @@ class AtomicGrid(Grid):
 
         Returns
         -------
-        tuple(AtomicGrid, np.ndarray(N,)), atomic grid and indices for each shell.
+        tuple(np.ndarray(M, 3), np.ndarray(M,), np.ndarray(N + 1,)), points and
+        weights of atomic grid and indices for each shell.
         """
         if len(degs) != rad_grid.size:
             raise ValueError("The shape of radial grid does not match given degs.")
-        all_points, all_weights = [], []
         sphere_grids = AtomicGrid._preload_unit_sphere_grid(degs)
-        index_array = np.zeros(len(degs) + 1, dtype=int)  # set index to int
-        for i, j in enumerate(degs):
-            points, weights = AtomicGrid._generate_sphere_grid(
-                rad_grid[i], sphere_grids[j]
-            )
-            index_array[i + 1] = index_array[i] + len(points)
-            all_points.append(points)
-            all_weights.append(weights)
-        indices = index_array
-        points = np.vstack(all_points)
-        weights = np.hstack(all_weights)
-        # atomic_grid = AtomicGrid(
-        #     np.vstack(all_points) + center, np.hstack(all_weights), center
-        # )
-        return points, weights, indices
+        # set index to int
+        index_array = np.zeros(len(degs) + 1, dtype=int)
+        index_array[1:] = np.cumsum([sphere_grids[i].size for i in degs])
+        points = np.empty((index_array[-1], 3))
+        weights = np.empty(index_array[-1])
+        # all shells of one degree are filled at once
+        for deg, sphere_grid in sphere_grids.items():
+            shells = np.nonzero(degs == deg)[0]
+            rad_pts = rad_grid.points[shells][:, None]
+            rad_wts = rad_grid.weights[shells][:, None]
+            dest = (index_array[shells][:, None] + np.arange(sphere_grid.size)).ravel()
+            points[dest] = (sphere_grid.points * rad_pts[..., None]).reshape(-1, 3)
+            weights[dest] = (sphere_grid.weights * rad_wts * rad_pts ** 2).ravel()
+        return points, weights, index_array
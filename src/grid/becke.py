@@ -21,12 +21,247 @@
 # --
 """Becke Weights Module."""
 
-import warnings
+from grid.utils import get_chunk_size
 
 import numpy as np
 
+from scipy.spatial import cKDTree
 
-class BeckeWeights:
+
+class AtomPairTable:
+    """Atom pair quantities shared by atomic partitioning schemes.
+
+    The table is built once for a molecular geometry and can be passed to
+    every weight evaluation of that geometry, e.g. for extra point sets.
+    """
+
+    def __init__(self, atom_coors, radii=None):
+        """Construct the atom pair table.
+
+        Parameters
+        ----------
+        atom_coors : np.ndarray(N, 3)
+            Coordinates for each atom in molecule
+        radii : np.ndarray(N,), optional
+            Covalent radii for each atom, needed for the size adjustments
+
+        Raises
+        ------
+        ValueError
+            Shape of atom_coors or radii is not valid
+        """
+        if atom_coors.ndim != 2:
+            raise ValueError(
+                f"Atom coors need to be in shape (N, 3), got {atom_coors.shape}"
+            )
+        if radii is not None and len(radii) != len(atom_coors):
+            raise ValueError(
+                f"radii need to have {len(atom_coors)} entries, got {len(radii)}"
+            )
+        self._coors = atom_coors
+        self._radii = radii
+        self._dists = BeckeWeights._atomic_dists(atom_coors)
+        self._pairs = np.triu_indices(len(atom_coors), 1)
+        self._inv_dists = np.zeros_like(self._dists)
+        self._inv_dists[self._pairs] = 1 / self._dists[self._pairs]
+        self._inv_dists += self._inv_dists.T
+        self._alpha = None
+        if radii is not None:
+            self._alpha = BeckeWeights._calculate_alpha(radii)
+        self._tree = None
+
+    @property
+    def coors(self):
+        """np.ndarray(N, 3): Coordinates of each atom."""
+        return self._coors
+
+    @property
+    def radii(self):
+        """np.ndarray(N,) or None: Covalent radii of each atom."""
+        return self._radii
+
+    @property
+    def size(self):
+        """int: Number of atoms."""
+        return len(self._coors)
+
+    @property
+    def dists(self):
+        """np.ndarray(N, N): Distance between each pair of atoms."""
+        return self._dists
+
+    @property
+    def inv_dists(self):
+        """np.ndarray(N, N): Inverse distance of each pair, zero on diagonal."""
+        return self._inv_dists
+
+    @property
+    def alpha(self):
+        """np.ndarray(N, N) or None: Becke size adjustment of each pair."""
+        return self._alpha
+
+    @property
+    def pairs(self):
+        """tuple(np.ndarray, np.ndarray): Indices (A, B) of pairs with A < B."""
+        return self._pairs
+
+    @property
+    def nearest_dists(self):
+        """np.ndarray(N,): Nearest neighbour distance of each atom, inf if alone."""
+        if self.size == 1:
+            return np.array([np.inf])
+        return np.min(self._dists + np.diag(np.full(self.size, np.inf)), axis=1)
+
+    @property
+    def tree(self):
+        """scipy.spatial.cKDTree: Spatial tree of atom coordinates."""
+        if self._tree is None:
+            self._tree = cKDTree(self._coors)
+        return self._tree
+
+    def neighbours(self, cutoff):
+        """Find the neighbours of each atom within a cutoff distance.
+
+        Parameters
+        ----------
+        cutoff : float
+            Largest distance between neighbouring atoms
+
+        Returns
+        -------
+        list[np.ndarray]
+            Sorted indices of the neighbours of each atom, excluding itself
+        """
+        lists = self.tree.query_ball_point(self._coors, cutoff)
+        return [np.array(sorted(set(j) - {i}), dtype=int) for i, j in enumerate(lists)]
+
+
+class CellWeights:
+    """Shared functions of weights from products of atomic cell functions."""
+
+    @staticmethod
+    def _get_chunk_size(
+        n_atoms, n_points, chunk_size=None, max_memory=None, n_arrays=3
+    ):
+        """Compute the number of points processed in each block.
+
+        Parameters
+        ----------
+        n_atoms : int
+            Number of atoms in the molecule
+        n_points : int
+            Total number of points to be processed
+        chunk_size : int, optional
+            Preferred number of points in each block
+        max_memory : int, optional
+            Upper bound (in bytes) of the scratch memory used for each block
+        n_arrays : int, default to 3
+            Number of (N, N) float64 arrays needed for each point
+
+        Returns
+        -------
+        int
+            Number of points in each block, at least 1
+        """
+        # (N, N) arrays and one (N, 4) float64 array for each point
+        point_bytes = 8 * (n_arrays * n_atoms ** 2 + 4 * n_atoms)
+        return get_chunk_size(n_points, point_bytes, chunk_size, max_memory)
+
+    @staticmethod
+    def _select_atoms(n_points, atom_coors, select, pt_ind):
+        """Find the selected atom for each point in the sectors.
+
+        Parameters
+        ----------
+        n_points : int
+            Total number of points
+        atom_coors : np.ndarray(N, 3)
+            Coordinates for each atom in molecule
+        select : list
+            Index of atom index to calculate weights for each sector
+        pt_ind : list
+            Index of points for splitting sectors
+
+        Returns
+        -------
+        tuple(int, int, np.ndarray(K,))
+            Index of the first and last (excluded) point in the sectors, and
+            the selected atom index for each point in between
+
+        Raises
+        ------
+        ValueError
+            Inconsistent select, pt_ind or atom_coors
+        """
+        # select could be an array for more complicated case
+        if len(pt_ind) == 1:
+            raise ValueError("pt_ind need include the ends of each section")
+        sectors = max(len(pt_ind) - 1, 1)  # total sectors
+        if atom_coors.ndim != 2:
+            raise ValueError(
+                f"Atom coors need to be in shape (N, 3), got {atom_coors.shape}"
+            )
+        if len(select) == 0:
+            select = np.arange(len(atom_coors))
+        if sectors != len(select):
+            raise ValueError("# of selec does not equal to # of indices.")
+        if sectors == 1:
+            return 0, n_points, np.full(n_points, select[0], dtype=int)
+        return pt_ind[0], pt_ind[-1], np.repeat(select, np.diff(pt_ind))
+
+    @staticmethod
+    def _normalize_cell_products(cell_prod, pt_select):
+        """Compute weights of the selected atoms from cell function products.
+
+        Parameters
+        ----------
+        cell_prod : np.ndarray(N, M)
+            Product of cell functions for each atom and point
+        pt_select : np.ndarray(M,)
+            Index of selected atom for each point
+
+        Returns
+        -------
+        np.ndarray(M,)
+            Weights of the selected atom for each point
+        """
+        # accumulate atom by atom, so the sum does not depend on block size
+        total = cell_prod[0].copy()
+        for prod_a in cell_prod[1:]:
+            total += prod_a
+        return cell_prod[pt_select, np.arange(len(pt_select))] / total
+
+    @staticmethod
+    def _generate_in_blocks(points, pt_select, cell_products, chunk):
+        """Compute weights of the selected atoms block by block.
+
+        Parameters
+        ----------
+        points : np.ndarray(M, 3)
+            Coordinates for each grid point
+        pt_select : np.ndarray(M,)
+            Index of selected atom for each point
+        cell_products : callable
+            Function of the points in a block, returning the products of cell
+            functions for each atom and point, of shape (N, block size)
+        chunk : int
+            Number of points in each block
+
+        Returns
+        -------
+        np.ndarray(M,)
+            Weights of the selected atom for each point
+        """
+        weights = np.zeros(len(points))
+        for begin in range(0, len(points), chunk):
+            stop = min(begin + chunk, len(points))
+            weights[begin:stop] = CellWeights._normalize_cell_products(
+                cell_products(points[begin:stop]), pt_select[begin:stop]
+            )
+        return weights
+
+
+class BeckeWeights(CellWeights):
     """Beckec weights functions holder class."""
 
     @staticmethod
@@ -93,15 +328,240 @@ class BeckeWeights:
             result of switching function
         """
         for i in range(order):
-            x = 1.5 * x - 0.5 * x ** 3
+            # x * x * x instead of x ** 3 keeps the function exactly odd
+            x = 1.5 * x - 0.5 * (x * x * x)
         return x
 
+    @staticmethod
+    def _compute_cell_products(points, pair_table, order, buffers):
+        r"""Compute the products of cell functions for a block of points.
+
+        .. math::
+            P_A(r) = \prod_{B \neq A} s(\mu_{AB}(r))
+
+        Parameters
+        ----------
+        points : np.ndarray(M, 3)
+            Coordinates for each grid point in the block
+        pair_table : AtomPairTable
+            Atom pair quantities of the molecule, with radii
+        order : int
+            Order of iteration for switching function
+        buffers : tuple(np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray)
+            Flat scratch arrays with at least 3NM, NM, N(N-1)M/2, N(N-1)M/2 and
+            N^2M entries, reused between blocks
+
+        Returns
+        -------
+        np.ndarray(N, M)
+            Product of cell functions for each atom and point
+        """
+        atom_coors = pair_table.coors
+        n_atoms, n_pts = len(atom_coors), len(points)
+        n_pairs = n_atoms * (n_atoms - 1) // 2
+        diff_buf, np_buf, pair_buf, tmp_buf, s_buf = buffers
+        diff = diff_buf[: 3 * n_atoms * n_pts].reshape(n_atoms, n_pts, 3)
+        n_p = np_buf[: n_atoms * n_pts].reshape(n_atoms, n_pts)
+        f_ab = pair_buf[: n_pairs * n_pts].reshape(n_pairs, n_pts)
+        tmp = tmp_buf[: n_pairs * n_pts].reshape(n_pairs, n_pts)
+        s_ab = s_buf[: n_atoms ** 2 * n_pts].reshape(n_atoms, n_atoms, n_pts)
+        # |r_A - r| for each points, nucleus pair
+        np.subtract(atom_coors[:, None], points, out=diff)
+        np.multiply(diff, diff, out=diff)
+        np.add.reduce(diff, axis=-1, out=n_p)
+        np.sqrt(n_p, out=n_p)
+        # switching function is odd, so only pairs A < B are computed
+        ind_a, ind_b = pair_table.pairs
+        # (|r_A - r| - |r_B - r|) / R_AB for each points with pair(A, B) nucleus
+        np.take(n_p, ind_a, axis=0, out=f_ab)
+        np.take(n_p, ind_b, axis=0, out=tmp)
+        np.subtract(f_ab, tmp, out=f_ab)
+        np.multiply(f_ab, pair_table.inv_dists[ind_a, ind_b][:, None], out=f_ab)
+        # nu_AB = mu_AB + a_AB * (1 - mu_AB^2)
+        np.square(f_ab, out=tmp)
+        np.subtract(1, tmp, out=tmp)
+        np.multiply(pair_table.alpha[ind_a, ind_b][:, None], tmp, out=tmp)
+        np.add(f_ab, tmp, out=f_ab)
+        # switching function, same as BeckeWeights._switch_func
+        for i in range(order):
+            np.multiply(f_ab, f_ab, out=tmp)
+            np.multiply(tmp, f_ab, out=tmp)
+            np.multiply(0.5, tmp, out=tmp)
+            np.multiply(1.5, f_ab, out=f_ab)
+            np.subtract(f_ab, tmp, out=f_ab)
+        # s_AB = (1 - f_AB) / 2, s_BA = (1 + f_AB) / 2 and s_AA = 1
+        np.subtract(1, f_ab, out=tmp)
+        np.multiply(0.5, tmp, out=tmp)
+        s_ab[ind_a, ind_b] = tmp
+        np.add(1, f_ab, out=tmp)
+        np.multiply(0.5, tmp, out=tmp)
+        s_ab[ind_b, ind_a] = tmp
+        s_ab[np.arange(n_atoms), np.arange(n_atoms)] = 1
+        # product up A_B, A_C, A_D ... along rows
+        return np.prod(s_ab, axis=1)
+
+    @staticmethod
+    def _screen_ratios(pair_table, order, tol):
+        r"""Compute the screening radius of points nearest to each atom.
+
+        For a point with nearest atom C at distance d, every atom B farther
+        than :math:`r_B \geq d (1 + m_C) / (1 - m_C)` has
+        :math:`\mu_{BC} \geq m_C` by the triangle inequality. The bound
+        :math:`m_C` is chosen such that :math:`s(\nu_{BC}) \leq tol` for the
+        smallest size adjustment of C, so :math:`P_B \leq tol`.
+
+        Parameters
+        ----------
+        pair_table : AtomPairTable
+            Atom pair quantities of the molecule, with radii
+        order : int
+            Order of iteration for switching function
+        tol : float
+            Largest cell function value treated as zero
+
+        Returns
+        -------
+        np.ndarray(N,)
+            Ratio of screening radius to nearest atom distance for each atom
+        """
+        n_atoms = pair_table.size
+        a_c = np.min(pair_table.alpha + np.diag(np.full(n_atoms, np.inf)), axis=0)
+        # s(m + a (1 - m^2)) decreases with m, find the smallest saturated m
+        lower, upper = np.zeros(n_atoms), np.ones(n_atoms)
+        for i in range(60):
+            mid = 0.5 * (lower + upper)
+            v_pp = mid + a_c * (1 - mid ** 2)
+            saturated = 0.5 * (1 - BeckeWeights._switch_func(v_pp, order)) <= tol
+            upper = np.where(saturated, mid, upper)
+            lower = np.where(saturated, lower, mid)
+        with np.errstate(divide="ignore"):
+            return (1 + upper) / (1 - upper)
+
+    @staticmethod
+    def _screen_neighbours(points, pair_table, radius, nearest):
+        """Find the atoms within a screening radius of each point.
+
+        Parameters
+        ----------
+        points : np.ndarray(M, 3)
+            Coordinates for each grid point in the block
+        pair_table : AtomPairTable
+            Atom pair quantities of the molecule
+        radius : np.ndarray(M,)
+            Screening radius of each point
+        nearest : np.ndarray(M,)
+            Index of the nearest atom of each point
+
+        Returns
+        -------
+        tuple(np.ndarray(K,), np.ndarray(K,))
+            Index of point and atom of each neighbour pair, sorted by point
+            and then by atom
+        """
+        n_atoms = pair_table.size
+        keys = []
+        # points with radius in the same power of two share one tree query
+        levels = np.ceil(np.log2(np.maximum(radius, 2.0 ** -60)))
+        for level in np.unique(levels):
+            group = np.nonzero(levels == level)[0]
+            pairs = cKDTree(points[group]).sparse_distance_matrix(
+                pair_table.tree, 2.0 ** level, output_type="ndarray"
+            )
+            pt_ind = group[pairs["i"]]
+            keep = pairs["v"] <= radius[pt_ind]
+            keys.append(pt_ind[keep] * n_atoms + pairs["j"][keep])
+        # the nearest atom is always a neighbour, also with rounding errors
+        keys.append(np.arange(len(points)) * n_atoms + nearest)
+        keys = np.unique(np.concatenate(keys))
+        return keys // n_atoms, keys % n_atoms
+
+    @staticmethod
+    def _compute_screened_cell_products(points, pair_table, order, tol):
+        r"""Compute the products of cell functions, skipping distant atoms.
+
+        For each point, only atoms within the screening radius of
+        :func:`BeckeWeights._screen_ratios` are found with a spatial tree of
+        the atoms. Farther atoms B have :math:`P_B(r) \leq tol` and are
+        dropped, and their cell functions are taken as 1 in the products of
+        the remaining atoms, so the cost scales with the number of
+        neighbours of each point. Points whose pairs are not saturated have
+        all atoms as neighbours and get the full product of
+        :func:`BeckeWeights._compute_cell_products`.
+
+        Parameters
+        ----------
+        points : np.ndarray(M, 3)
+            Coordinates for each grid point in the block
+        pair_table : AtomPairTable
+            Atom pair quantities of the molecule, with radii
+        order : int
+            Order of iteration for switching function
+        tol : float
+            Largest cell function value treated as zero, positive
+
+        Returns
+        -------
+        np.ndarray(N, M)
+            Product of cell functions for each atom and point
+        """
+        atom_coors, inv_dists, alpha = (
+            pair_table.coors,
+            pair_table.inv_dists,
+            pair_table.alpha,
+        )
+        n_atoms, n_pts = len(atom_coors), len(points)
+        near_dists, nearest = pair_table.tree.query(points)
+        ratios = BeckeWeights._screen_ratios(pair_table, order, tol)
+        with np.errstate(invalid="ignore"):
+            radius = np.where(near_dists > 0, near_dists * ratios[nearest], 0)
+        pt_ind, atom_ind = BeckeWeights._screen_neighbours(
+            points, pair_table, radius, nearest
+        )
+        counts = np.bincount(pt_ind, minlength=n_pts)
+        starts = np.cumsum(counts) - counts
+        cell_prod = np.zeros((n_atoms, n_pts))
+        # points with the same number of neighbours are computed together
+        for n_near in np.unique(counts):
+            pts = np.nonzero(counts == n_near)[0]
+            atoms = atom_ind[starts[pts][:, None] + np.arange(n_near)]
+            # |r_A - r| for each point and its neighbours
+            diff = atom_coors[atoms] - points[pts][:, None]
+            n_p = np.sqrt(np.add.reduce(diff * diff, axis=-1))
+            # switching function is odd, so only neighbour pairs A < B are
+            # computed, same as BeckeWeights._compute_cell_products
+            ind_a, ind_b = np.triu_indices(n_near, 1)
+            pair_ind = atoms[:, ind_a] * n_atoms + atoms[:, ind_b]
+            f_ab = n_p[:, ind_a] - n_p[:, ind_b]
+            f_ab *= np.take(inv_dists, pair_ind)
+            f_ab += np.take(alpha, pair_ind) * (1 - f_ab ** 2)
+            f_ab = BeckeWeights._switch_func(f_ab, order=order)
+            s_ab = np.ones((len(pts), n_near, n_near))
+            s_ab[:, ind_a, ind_b] = 0.5 * (1 - f_ab)
+            s_ab[:, ind_b, ind_a] = 0.5 * (1 + f_ab)
+            cell_prod[atoms, pts[:, None]] = np.prod(s_ab, axis=2)
+        return cell_prod
+
     @staticmethod
     def generate_becke_weights(
-        points, radii, atom_coors, *, select=[], pt_ind=[], order=3
+        points,
+        radii,
+        atom_coors,
+        *,
+        select=[],
+        pt_ind=[],
+        order=3,
+        chunk_size=None,
+        max_memory=None,
+        screen=False,
+        screen_tol=1e-10,
+        pair_table=None,
     ):
         """Calculate becke weights of points for select atom.
 
+        Points are processed in blocks, so the peak memory is bounded by the
+        block size instead of the total number of points. The result does not
+        depend on the block size.
+
         Parameters
         ----------
         points : np.ndarray(M, 3)
@@ -116,48 +576,397 @@ class BeckeWeights:
             Index of points for splitting sectors
         order : int, default to 3
             Order of iteration for switching function
+        chunk_size : int, optional
+            Number of points processed in each block. If given, max_memory is
+            ignored.
+        max_memory : int, optional
+            Upper bound (in bytes) of the scratch memory for each block. If
+            neither chunk_size nor max_memory is given, all points are
+            processed in one block.
+        screen : bool, default to False
+            Whether to only evaluate the cell functions of atoms near each
+            point. Neighbours are found with a spatial tree of the atoms, so
+            the cost scales roughly linearly with the size of the molecule.
+        screen_tol : float, default to 1e-10
+            Cell function value below which an atom is skipped when screen is
+            True. Each dropped atom has a cell function product below
+            screen_tol, but the errors add up over all dropped atoms and
+            their omitted factors, so the weights are only accurate to about
+            100 times screen_tol (measured on random molecules of 7 to 25
+            atoms). The Becke switching function never saturates, so zero or
+            a negative value gives the exact weights without screening.
+        pair_table : AtomPairTable, optional
+            Precomputed atom pair quantities of atom_coors and radii, built if
+            not given
 
         Return
         ------
         np.ndarray(M, )
             Becke weights for each grid point
         """
-        # select could be an array for more complicated case
-        # |r_A - r| for each points, nucleus pair
-        if len(pt_ind) == 1:
-            raise ValueError("pt_ind need include the ends of each section")
-        sectors = max(len(pt_ind) - 1, 1)  # total sectors
         weights = np.zeros(len(points))
-        if atom_coors.ndim != 2:
-            raise ValueError(
-                f"Atom coors need to be in shape (N, 3), got {atom_coors.shape}"
-            )
-        if select == []:
-            select = np.arange(len(atom_coors))
-        if sectors != len(select):
-            raise ValueError("# of selec does not equal to # of indices.")
-        n_p = np.linalg.norm(atom_coors[:, None] - points, axis=-1)
-        # |r_A - r| - |r_B - r| for each points with pair(A, B) nucleus
-        p_p_n = n_p[:, None] - n_p
-        atomic_dist = BeckeWeights._atomic_dists(atom_coors)
-        # ignore 0 / 0 runtime warning
-        with warnings.catch_warnings():
-            warnings.simplefilter("ignore")
-            mu_n_p_p = p_p_n.transpose([2, 0, 1]) / atomic_dist
-        alpha = BeckeWeights._calculate_alpha(radii)
-        v_pp = mu_n_p_p + alpha * (1 - mu_n_p_p ** 2)
-        s_ab = 0.5 * (1 - BeckeWeights._switch_func(v_pp, order=order))
-        # convert nan to 1
-        s_ab[np.isnan(s_ab)] = 1
-        # product up A_B, A_C, A_D ... along rows
-        s_ab = np.prod(s_ab, axis=-1)
-        # calculate weight for each point in select
-        if sectors == 1:
-            weights += s_ab[:, select[0]] / np.sum(s_ab, axis=-1)
+        start, end, pt_select = BeckeWeights._select_atoms(
+            len(points), atom_coors, select, pt_ind
+        )
+        n_atoms = len(atom_coors)
+        chunk = BeckeWeights._get_chunk_size(
+            n_atoms, end - start, chunk_size=chunk_size, max_memory=max_memory
+        )
+        chunk = min(chunk, max(end - start, 1))
+        if pair_table is None:
+            pair_table = AtomPairTable(atom_coors, radii)
+        if screen and screen_tol > 0 and n_atoms > 1:
+
+            def cell_products(sub_points):
+                return BeckeWeights._compute_screened_cell_products(
+                    sub_points, pair_table, order, screen_tol
+                )
+
         else:
-            for i in range(sectors):
-                sub_s_ab = s_ab[pt_ind[i] : pt_ind[i + 1]]
-                weights[pt_ind[i] : pt_ind[i + 1]] += sub_s_ab[:, select[i]] / np.sum(
-                    sub_s_ab, axis=-1
+            # scratch buffers shared by all blocks
+            n_pairs = n_atoms * (n_atoms - 1) // 2
+            buffers = (
+                np.empty(3 * n_atoms * chunk),
+                np.empty(n_atoms * chunk),
+                np.empty(n_pairs * chunk),
+                np.empty(n_pairs * chunk),
+                np.empty(n_atoms ** 2 * chunk),
+            )
+
+            def cell_products(sub_points):
+                return BeckeWeights._compute_cell_products(
+                    sub_points, pair_table, order, buffers
                 )
+
+        weights[start:end] = BeckeWeights._generate_in_blocks(
+            points[start:end], pt_select, cell_products, chunk
+        )
+        return weights
+
+    @staticmethod
+    def _compute_weight_derivs(points, pair_table, order, pt_select):
+        r"""Compute becke weights and their derivatives for a block of points.
+
+        The derivatives are taken with respect to the atomic coordinates at
+        fixed point positions,
+
+        .. math::
+            \frac{\partial w_S}{\partial R_A} = \frac{1}{Z}\left(
+                \frac{\partial P_S}{\partial R_A}
+                - w_S \sum_C \frac{\partial P_C}{\partial R_A}\right),
+            \quad Z = \sum_C P_C
+
+        Parameters
+        ----------
+        points : np.ndarray(M, 3)
+            Coordinates for each grid point in the block
+        pair_table : AtomPairTable
+            Atom pair quantities of the molecule, with radii
+        order : int
+            Order of iteration for switching function
+        pt_select : np.ndarray(M,)
+            Index of selected atom for each point
+
+        Returns
+        -------
+        tuple(np.ndarray(M,), np.ndarray(M, N, 3))
+            Becke weights and their derivatives for each point
+        """
+        atom_coors, inv_dists = pair_table.coors, pair_table.inv_dists
+        n_atoms, n_pts = len(atom_coors), len(points)
+        pt_range = np.arange(n_pts)
+        # (R_C - r) / |R_C - r|, set to zero for points on the nucleus
+        diff = atom_coors[:, None] - points
+        n_p = np.linalg.norm(diff, axis=-1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            unit = np.nan_to_num(diff / n_p[..., None])
+        # mu_AB, switching function and its derivative for pairs A < B
+        ind_a, ind_b = pair_table.pairs
+        mu = (n_p[ind_a] - n_p[ind_b]) * inv_dists[ind_a, ind_b][:, None]
+        a_ab = pair_table.alpha[ind_a, ind_b][:, None]
+        f_ab = mu + a_ab * (1 - mu ** 2)
+        df_ab = np.ones_like(f_ab)
+        for i in range(order):
+            df_ab *= 1.5 * (1 - f_ab * f_ab)
+            f_ab = 1.5 * f_ab - 0.5 * (f_ab * f_ab * f_ab)
+        # d s_AB / d mu_AB, which equals d s_BA / d mu_BA
+        ds_ab = -0.5 * df_ab * (1 - 2 * a_ab * mu)
+        s_ab = np.ones((n_atoms, n_atoms, n_pts))
+        s_ab[ind_a, ind_b] = 0.5 * (1 - f_ab)
+        s_ab[ind_b, ind_a] = 0.5 * (1 + f_ab)
+        mu_ab = np.zeros((n_atoms, n_atoms, n_pts))
+        mu_ab[ind_a, ind_b] = mu
+        mu_ab[ind_b, ind_a] = -mu
+        # products of all cell functions of atom C except the D one, which
+        # stays finite when s_CD = 0
+        excl = np.empty((n_atoms, n_atoms, n_pts))
+        excl[:, 0] = 1
+        np.cumprod(s_ab[:, :-1], axis=1, out=excl[:, 1:])
+        cell_prod = excl[:, -1] * s_ab[:, -1]
+        # reuse s_ab for the products of the cell functions after D
+        np.cumprod(s_ab[:, :0:-1], axis=1, out=s_ab[:, :-1])
+        excl[:, :-1] *= s_ab[:, -2::-1]
+        del s_ab
+        # q_CD = dP_C / d mu_CD / R_CD
+        q_cd = np.zeros((n_atoms, n_atoms, n_pts))
+        q_cd[ind_a, ind_b] = ds_ab * inv_dists[ind_a, ind_b][:, None]
+        q_cd[ind_b, ind_a] = q_cd[ind_a, ind_b]
+        q_cd *= excl
+        del excl
+        # unit vector e_CD = (R_C - R_D) / R_CD
+        e_cd = (atom_coors[:, None] - atom_coors) * inv_dists[..., None]
+        # d mu_CD / d R_D = (mu_CD e_CD - u_D) / R_CD
+        # d mu_CD / d R_C = (u_C - mu_CD e_CD) / R_CD
+        # the (N, N, M, 3) derivatives of all cell products are never formed,
+        # only the selected atom and the sum over all atoms are needed
+        qmu_cd = q_cd * mu_ab
+        unit_t = unit.transpose(1, 0, 2)
+        # d P_S / d R_D of the selected atom S for D != S, zero for D = S
+        q_s, qmu_s = q_cd[pt_select, :, pt_range], qmu_cd[pt_select, :, pt_range]
+        sel_deriv = qmu_s[..., None] * e_cd[pt_select] - q_s[..., None] * unit_t
+        self_deriv = np.sum(q_s, axis=1)[:, None] * unit_t[pt_range, pt_select]
+        self_deriv -= np.einsum("pd,pdx->px", qmu_s, e_cd[pt_select])
+        sel_deriv[pt_range, pt_select] += self_deriv
+        # sum_C d P_C / d R_A, from C != A and from C = A
+        sum_deriv = np.matmul(qmu_cd.transpose(1, 2, 0), e_cd.transpose(1, 0, 2))
+        sum_deriv -= np.matmul(qmu_cd.transpose(0, 2, 1), e_cd)
+        sum_deriv += (np.sum(q_cd, axis=1) - np.sum(q_cd, axis=0))[..., None] * unit
+        sum_deriv = sum_deriv.transpose(1, 0, 2)
+        # quotient rule for w_S = P_S / Z
+        total = np.sum(cell_prod, axis=0)
+        weights = cell_prod[pt_select, pt_range] / total
+        deriv = sel_deriv - weights[:, None, None] * sum_deriv
+        deriv /= total[:, None, None]
+        return weights, deriv
+
+    @staticmethod
+    def generate_becke_weights_deriv(
+        points,
+        radii,
+        atom_coors,
+        *,
+        select=[],
+        pt_ind=[],
+        order=3,
+        moving_points=False,
+        chunk_size=None,
+        max_memory=None,
+        pair_table=None,
+    ):
+        """Calculate becke weights and their derivatives to atomic coordinates.
+
+        Parameters
+        ----------
+        points : np.ndarray(M, 3)
+            Coordinates for each grid point
+        radii : np.ndarray(N,)
+            Covalent radiis for each atom in molecule
+        atom_coors : np.ndarray(N, 3)
+            Coordinates for each atom in molecule
+        select : list,
+            Index of atom index to calculate becke weights
+        pt_ind : list, optional
+            Index of points for splitting sectors
+        order : int, default to 3
+            Order of iteration for switching function
+        moving_points : bool, default to False
+            If True, the points in each sector move together with the selected
+            atom, as for the points of an atomic grid. Otherwise the points
+            are fixed in space.
+        chunk_size : int, optional
+            Number of points processed in each block. If given, max_memory is
+            ignored.
+        max_memory : int, optional
+            Upper bound (in bytes) of the scratch memory for each block. If
+            neither chunk_size nor max_memory is given, all points are
+            processed in one block.
+        pair_table : AtomPairTable, optional
+            Precomputed atom pair quantities of atom_coors and radii, built if
+            not given
+
+        Return
+        ------
+        tuple(np.ndarray(M,), np.ndarray(M, N, 3))
+            Becke weights for each grid point, and their derivatives with
+            respect to the coordinates of each atom
+        """
+        weights = np.zeros(len(points))
+        deriv = np.zeros((len(points), len(atom_coors), 3))
+        start, end, pt_select = BeckeWeights._select_atoms(
+            len(points), atom_coors, select, pt_ind
+        )
+        n_atoms = len(atom_coors)
+        # derivatives need about eight (N, N) arrays for each point
+        chunk = BeckeWeights._get_chunk_size(
+            n_atoms,
+            end - start,
+            chunk_size=chunk_size,
+            max_memory=max_memory,
+            n_arrays=8,
+        )
+        if pair_table is None:
+            pair_table = AtomPairTable(atom_coors, radii)
+        for begin in range(start, end, chunk):
+            stop = min(begin + chunk, end)
+            sub_select = pt_select[begin - start : stop - start]
+            sub_w, sub_d = BeckeWeights._compute_weight_derivs(
+                points[begin:stop], pair_table, order, sub_select
+            )
+            if moving_points:
+                # translation invariance: d w / d r = -sum_A d w / d R_A
+                sub_d[np.arange(stop - begin), sub_select] -= np.sum(sub_d, axis=1)
+            weights[begin:stop] = sub_w
+            deriv[begin:stop] = sub_d
+        return weights, deriv
+
+
+class SSFWeights(CellWeights):
+    """Stratmann-Scuseria-Frisch weights functions holder class."""
+
+    @staticmethod
+    def _switch_func(x, a=0.64):
+        r"""Piecewise switching function of Stratmann, Scuseria and Frisch.
+
+        .. math::
+            g(x) = \begin{cases}
+                -1 & x \leq -a \\
+                \frac{1}{16}\left(35 z - 35 z^3 + 21 z^5 - 5 z^7\right),
+                    \ z = x / a & |x| < a \\
+                1 & x \geq a
+            \end{cases}
+
+        Parameters
+        ----------
+        x : float or np.ndarray
+            Input variable
+        a : float, default to 0.64
+            Half width of the region where the function is not saturated
+
+        Returns
+        -------
+        float or np.ndarray
+            result of switching function
+        """
+        z = np.clip(x / a, -1, 1)
+        z_2 = z ** 2
+        return z * (35 + z_2 * (-35 + z_2 * (21 - 5 * z_2))) / 16
+
+    @staticmethod
+    def _compute_cell_products(points, pair_table, a):
+        r"""Compute the products of cell functions for a block of points.
+
+        .. math::
+            P_A(r) = \prod_{B \neq A} \frac{1}{2}\left(1 - g(\mu_{AB}(r))\right)
+
+        Parameters
+        ----------
+        points : np.ndarray(M, 3)
+            Coordinates for each grid point in the block
+        pair_table : AtomPairTable
+            Atom pair quantities of the molecule
+        a : float
+            Parameter of the switching function
+
+        Returns
+        -------
+        np.ndarray(N, M)
+            Product of cell functions for each atom and point
+        """
+        atom_coors = pair_table.coors
+        n_p = np.linalg.norm(atom_coors[:, None] - points, axis=-1)
+        s_ab = np.subtract(n_p[:, None], n_p)
+        s_ab *= pair_table.inv_dists[..., None]
+        # same as SSFWeights._switch_func, computed in place to save memory
+        s_ab /= a
+        np.clip(s_ab, -1, 1, out=s_ab)
+        z_2 = np.square(s_ab)
+        poly = -5 * z_2
+        poly += 21
+        poly *= z_2
+        poly -= 35
+        poly *= z_2
+        poly += 35
+        s_ab *= poly
+        s_ab /= 16
+        np.subtract(1, s_ab, out=s_ab)
+        s_ab *= 0.5
+        # s_AA = 1
+        s_ab[np.arange(len(atom_coors)), np.arange(len(atom_coors))] = 1
+        return np.prod(s_ab, axis=1)
+
+    @staticmethod
+    def generate_ssf_weights(
+        points,
+        atom_coors,
+        *,
+        select=[],
+        pt_ind=[],
+        a=0.64,
+        chunk_size=None,
+        max_memory=None,
+        pair_table=None,
+    ):
+        """Calculate Stratmann-Scuseria-Frisch weights of points for select atom.
+
+        A point closer to its selected atom than (1 - a) / 2 times the nearest
+        neighbour distance of that atom has weight 1, so its cell functions
+        are not computed.
+
+        Parameters
+        ----------
+        points : np.ndarray(M, 3)
+            Coordinates for each grid point
+        atom_coors : np.ndarray(N, 3)
+            Coordinates for each atom in molecule
+        select : list,
+            Index of atom index to calculate weights
+        pt_ind : list, optional
+            Index of points for splitting sectors
+        a : float, default to 0.64
+            Parameter of the switching function, 0 < a <= 1
+        chunk_size : int, optional
+            Number of points processed in each block. If given, max_memory is
+            ignored.
+        max_memory : int, optional
+            Upper bound (in bytes) of the scratch memory for each block. If
+            neither chunk_size nor max_memory is given, all points are
+            processed in one block.
+        pair_table : AtomPairTable, optional
+            Precomputed atom pair quantities of atom_coors, built if not given
+
+        Return
+        ------
+        np.ndarray(M, )
+            Stratmann-Scuseria-Frisch weights for each grid point
+
+        References
+        ----------
+        R. E. Stratmann, G. E. Scuseria, M. J. Frisch, Chem. Phys. Lett. 257,
+        213 (1996).
+        """
+        if not 0 < a <= 1:
+            raise ValueError(f"a need to be in (0, 1], got {a}")
+        weights = np.zeros(len(points))
+        start, end, pt_select = SSFWeights._select_atoms(
+            len(points), atom_coors, select, pt_ind
+        )
+        if pair_table is None:
+            pair_table = AtomPairTable(atom_coors)
+        # points deep inside the cell of selected atom have weight 1
+        sub_points = points[start:end]
+        dists = np.linalg.norm(sub_points - atom_coors[pt_select], axis=-1)
+        nearest = pair_table.nearest_dists
+        inner = dists < 0.5 * (1 - a) * nearest[pt_select]
+        weights[start:end][inner] = 1
+        # compute remaining points block by block
+        outer = np.nonzero(~inner)[0]
+        chunk = SSFWeights._get_chunk_size(
+            len(atom_coors), len(outer), chunk_size=chunk_size, max_memory=max_memory
+        )
+        weights[start + outer] = SSFWeights._generate_in_blocks(
+            sub_points[outer],
+            pt_select[outer],
+            lambda block: SSFWeights._compute_cell_products(block, pair_table, a),
+            chunk,
+        )
         return weights
@@ -0,0 +1,412 @@
+# -*- coding: utf-8 -*-
+# GRID is a numerical integration library for quantum chemistry.
+#
+# Copyright (C) 2011-2019 The GRID Development Team
+#
+# This file is part of GRID.
+#
+# GRID is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# GRID is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+"""Hirshfeld and iterative Hirshfeld weights generation module."""
+
+from time import perf_counter
+
+from grid.becke import CellWeights
+from grid.utils import get_chunk_size
+
+import numpy as np
+
+from scipy.interpolate import CubicSpline
+
+
+class HirshfeldWeights:
+    """Hirshfeld weights from spherical pro-atom densities."""
+
+    @staticmethod
+    def spline_proatoms(proatoms):
+        """Construct cubic splines of radial pro-atom densities.
+
+        Entries of proatoms that are the same object (e.g. one entry per
+        element shared by all atoms of that element) are splined only once
+        and share the same spline.
+
+        Parameters
+        ----------
+        proatoms : list[tuple]
+            Radial pro-atom density of each atom, as (r, rho, ...) with r the
+            increasing radial points of shape (R,) and rho the densities of
+            shape (R,) or (P, R) for P pro-atoms. Further items are ignored.
+
+        Returns
+        -------
+        list[CubicSpline]
+            Radial pro-atom density spline of each atom
+
+        Raises
+        ------
+        ValueError
+            Radial points and densities do not match
+        """
+        splines = {}
+        for proatom in proatoms:
+            if id(proatom) in splines:
+                continue
+            r, rho = np.asarray(proatom[0]), np.asarray(proatom[1])
+            if r.ndim != 1 or rho.shape[-1] != r.size:
+                raise ValueError(
+                    f"Pro-atom densities of shape {rho.shape} do not match "
+                    f"radial points of shape {r.shape}"
+                )
+            splines[id(proatom)] = CubicSpline(r, rho, axis=-1)
+        return [splines[id(proatom)] for proatom in proatoms]
+
+    @staticmethod
+    def _eval_spline(spline, dists):
+        """Evaluate pro-atom density spline at given distances.
+
+        Densities are constant below the first radial point, zero beyond the
+        last radial point and clipped to be non-negative.
+
+        Parameters
+        ----------
+        spline : CubicSpline
+            Radial pro-atom density spline
+        dists : np.ndarray
+            Distances to the nucleus
+
+        Returns
+        -------
+        np.ndarray
+            Pro-atom densities, with shape of dists (prepended by (P,) for P
+            pro-atoms)
+        """
+        rho = spline(np.clip(dists, spline.x[0], spline.x[-1]))
+        np.maximum(rho, 0, out=rho)
+        rho[..., dists > spline.x[-1]] = 0
+        return rho
+
+    @staticmethod
+    def _proatom_densities(points, atom_coors, splines):
+        """Evaluate pro-atom densities of all atoms on points.
+
+        Parameters
+        ----------
+        points : np.ndarray(M, 3)
+            Coordinates for each grid point
+        atom_coors : np.ndarray(N, 3)
+            Coordinates for each atom in molecule
+        splines : list[CubicSpline]
+            Radial pro-atom density spline of each atom
+
+        Returns
+        -------
+        list[np.ndarray]
+            Pro-atom densities of each atom, of shape (M,) or (P, M)
+        """
+        diff = atom_coors[:, None] - points
+        dists = np.sqrt(np.add.reduce(diff * diff, axis=-1))
+        # evaluate each spline once for all atoms sharing it
+        groups = {}
+        for i, spline in enumerate(splines):
+            groups.setdefault(id(spline), []).append(i)
+        rho = [None] * len(splines)
+        for atoms in groups.values():
+            sub_rho = HirshfeldWeights._eval_spline(splines[atoms[0]], dists[atoms])
+            for j, atom in enumerate(atoms):
+                rho[atom] = sub_rho[..., j, :]
+        return rho
+
+    @staticmethod
+    def _share_density(rho_pro):
+        """Divide pro-atom densities by the pro-molecule density.
+
+        Points without pro-molecule density are shared equally by all atoms.
+
+        Parameters
+        ----------
+        rho_pro : np.ndarray(N, M)
+            Pro-atom densities of each atom on each point
+
+        Returns
+        -------
+        np.ndarray(N, M)
+            Hirshfeld weights of each atom on each point
+        """
+        total = np.sum(rho_pro, axis=0)
+        weights = np.full(rho_pro.shape, 1 / len(rho_pro))
+        np.divide(rho_pro, total, out=weights, where=total > 0)
+        return weights
+
+    @staticmethod
+    def generate_hirshfeld_weights(
+        points,
+        atom_coors,
+        splines,
+        *,
+        select=[],
+        pt_ind=[],
+        chunk_size=None,
+        max_memory=None,
+    ):
+        r"""Calculate Hirshfeld weights of points for select atom.
+
+        .. math::
+            w_A(\mathbf{r}) = \frac{\rho^0_A(|\mathbf{r} - \mathbf{R}_A|)}
+            {\sum_B \rho^0_B(|\mathbf{r} - \mathbf{R}_B|)}
+
+        Parameters
+        ----------
+        points : np.ndarray(M, 3)
+            Coordinates for each grid point
+        atom_coors : np.ndarray(N, 3)
+            Coordinates for each atom in molecule
+        splines : list[CubicSpline]
+            Radial pro-atom density spline of each atom, see spline_proatoms
+        select : list or integer, optional
+            Index of atom index to calculate Hirshfeld weights
+        pt_ind : list of integers, optional
+            Index of points for splitting sectors
+        chunk_size : int, optional, keyword-only argument
+            Number of points processed in one block.
+        max_memory : int, optional, keyword-only argument
+            Upper bound (in bytes) of the scratch memory used for one block.
+            Ignored if chunk_size is given. If both are None, all points are
+            processed in one block.
+
+        Return
+        ------
+        np.ndarray(M, )
+            Hirshfeld weights for each grid point
+
+        Raises
+        ------
+        ValueError
+            Number of splines does not match the number of atoms
+        """
+        start, end, pt_select = CellWeights._select_atoms(
+            len(points), atom_coors, select, pt_ind
+        )
+        if len(splines) != len(atom_coors):
+            raise ValueError(
+                f"Need {len(atom_coors)} pro-atom splines, got {len(splines)}"
+            )
+        # coordinate differences and their squares (3N each), distances,
+        # clipped distances, densities, their stack and shares (N each)
+        point_bytes = 8 * (11 * len(atom_coors) + 1)
+        chunk = get_chunk_size(end - start, point_bytes, chunk_size, max_memory)
+        weights = np.zeros(len(points))
+        for begin in range(start, end, chunk):
+            stop = min(begin + chunk, end)
+            rho_pro = np.array(
+                HirshfeldWeights._proatom_densities(
+                    points[begin:stop], atom_coors, splines
+                )
+            )
+            sub_select = pt_select[begin - start : stop - start]
+            weights[begin:stop] = HirshfeldWeights._share_density(rho_pro)[
+                sub_select, np.arange(stop - begin)
+            ]
+        return weights
+
+    @staticmethod
+    def _interpolate_proatoms(populations, pro_pops):
+        """Find linear interpolation of pro-atoms for given populations.
+
+        Parameters
+        ----------
+        populations : np.ndarray(N,)
+            Population of each atom
+        pro_pops : np.ndarray(N, P)
+            Increasing populations of the pro-atoms of each atom, padded with
+            np.inf for atoms with fewer than P pro-atoms
+
+        Returns
+        -------
+        tuple(np.ndarray(N,), np.ndarray(N,))
+            Index of the lower pro-atom of each atom and the fraction of the
+            next pro-atom. Populations outside the pro-atoms are extrapolated.
+        """
+        n_pro = np.sum(np.isfinite(pro_pops), axis=1)
+        # same as np.searchsorted(pro_pop, pop) - 1 for each atom
+        lower = np.sum(pro_pops < populations[:, None], axis=1) - 1
+        lower = np.clip(lower, 0, np.maximum(n_pro - 2, 0))
+        rows = np.arange(len(populations))
+        upper = np.minimum(lower + 1, n_pro - 1)
+        step = pro_pops[rows, upper] - pro_pops[rows, lower]
+        frac = np.zeros(len(populations))
+        np.divide(populations - pro_pops[rows, lower], step, out=frac, where=step > 0)
+        return lower, frac
+
+    @staticmethod
+    def generate_iterative_hirshfeld_weights(
+        points,
+        weights,
+        density,
+        atom_coors,
+        splines,
+        pro_populations,
+        *,
+        select=[],
+        pt_ind=[],
+        init_populations=None,
+        tol=1e-8,
+        max_iter=500,
+        chunk_size=None,
+        max_memory=None,
+    ):
+        r"""Calculate iterative Hirshfeld weights of points for select atom.
+
+        The pro-atom of each atom is linearly interpolated between pro-atoms
+        with the nearest populations, and the populations are updated by the
+        fixed-point iteration
+
+        .. math::
+            N_A^{(i + 1)} = \int w_A^{(i)}(\mathbf{r}) \rho(\mathbf{r})
+            d\mathbf{r}
+
+        until the largest change of population is smaller than tol. The
+        returned weights are computed from the last populations.
+
+        Parameters
+        ----------
+        points : np.ndarray(M, 3)
+            Coordinates for each grid point
+        weights : np.ndarray(M,)
+            Integration weights of each grid point
+        density : np.ndarray(M,)
+            Molecular density on each grid point
+        atom_coors : np.ndarray(N, 3)
+            Coordinates for each atom in molecule
+        splines : list[CubicSpline]
+            Radial pro-atom densities spline of each atom, evaluated to shape
+            (P, ...) for P pro-atoms, see spline_proatoms
+        pro_populations : list[np.ndarray]
+            Increasing populations of the P pro-atoms of each atom
+        select : list or integer, optional
+            Index of atom index to calculate iterative Hirshfeld weights
+        pt_ind : list of integers, optional
+            Index of points for splitting sectors
+        init_populations : np.ndarray(N,), optional, keyword-only argument
+            Initial guess of the population of each atom, default to the
+            middle pro-atom population of each atom
+        tol : float, default to 1e-8, keyword-only argument
+            Convergence threshold of the largest population change
+        max_iter : int, default to 500, keyword-only argument
+            Maximum number of iterations
+        chunk_size : int, optional, keyword-only argument
+            Number of points processed in one block.
+        max_memory : int, optional, keyword-only argument
+            Upper bound (in bytes) of the scratch memory. Ignored for the
+            block size if chunk_size is given. The densities of all pro-atoms
+            are kept between iterations if they fit in max_memory, otherwise
+            they are evaluated again for each block in every iteration. If
+            both are None, all points are processed in one block.
+
+        Return
+        ------
+        tuple(np.ndarray(M,), dict)
+            Iterative Hirshfeld weights for each grid point and the iteration
+            info with keys "populations", "n_iter", "converged", "change" (the
+            last largest population change) and "time" (in seconds)
+
+        Raises
+        ------
+        ValueError
+            Number of splines or pro-atom populations does not match the
+            number of atoms, or max_iter is smaller than 1
+        """
+        start_time = perf_counter()
+        start, end, pt_select = CellWeights._select_atoms(
+            len(points), atom_coors, select, pt_ind
+        )
+        n_atoms = len(atom_coors)
+        if len(splines) != n_atoms or len(pro_populations) != n_atoms:
+            raise ValueError(
+                f"Need {n_atoms} pro-atom splines and populations, "
+                f"got {len(splines)} and {len(pro_populations)}"
+            )
+        if max_iter < 1:
+            raise ValueError(f"max_iter should be at least 1, got {max_iter}")
+        pro_populations = [np.atleast_1d(pop) for pop in pro_populations]
+        n_pro = np.array([len(pop) for pop in pro_populations])
+        pro_pops = np.full((n_atoms, np.max(n_pro)), np.inf)
+        for pro_pop, pop in zip(pro_pops, pro_populations):
+            pro_pop[: len(pop)] = pop
+        # densities of all pro-atoms are stacked, with offset of each atom
+        offsets = np.cumsum(n_pro) - n_pro
+        n_stack = np.sum(n_pro)
+        # coordinate differences and their squares (3N each), distances (N),
+        # stacked densities, interpolated densities and shares (N each)
+        point_bytes = 8 * (7 * n_atoms + 2 * n_stack + 2)
+        chunk = get_chunk_size(len(points), point_bytes, chunk_size, max_memory)
+        stack_bytes = 8 * n_stack * len(points)
+        keep = max_memory is None or stack_bytes + chunk * point_bytes <= max_memory
+        stacks = {}
+
+        def share_density(begin, stop, lower, frac):
+            """Compute weights of all atoms on a block for interpolated pro-atoms."""
+            rho_pro = stacks.get(begin)
+            if rho_pro is None:
+                rho_pro = HirshfeldWeights._proatom_densities(
+                    points[begin:stop], atom_coors, splines
+                )
+                rho_pro = np.concatenate(
+                    [rho.reshape(-1, stop - begin) for rho in rho_pro]
+                )
+                if keep:
+                    stacks[begin] = rho_pro
+            upper = np.minimum(lower + 1, n_pro - 1)
+            rho = rho_pro[offsets + lower] * (1 - frac)[:, None]
+            rho += rho_pro[offsets + upper] * frac[:, None]
+            np.maximum(rho, 0, out=rho)
+            return HirshfeldWeights._share_density(rho)
+
+        if init_populations is None:
+            populations = np.array([pop[len(pop) // 2] for pop in pro_populations])
+        else:
+            populations = np.array(init_populations, dtype=float)
+        wdens = weights * density
+        n_iter, change = 0, np.inf
+        while n_iter < max_iter and not change < tol:
+            lower, frac = HirshfeldWeights._interpolate_proatoms(populations, pro_pops)
+            new_populations = np.zeros(n_atoms)
+            for begin in range(0, len(points), chunk):
+                stop = min(begin + chunk, len(points))
+                aim_weights = share_density(begin, stop, lower, frac)
+                new_populations += aim_weights @ wdens[begin:stop]
+            change = np.max(np.abs(new_populations - populations))
+            populations = new_populations
+            n_iter += 1
+        # weights of the selected atoms from the last populations
+        lower, frac = HirshfeldWeights._interpolate_proatoms(populations, pro_pops)
+        sub_weights = np.zeros(len(points))
+        for begin in range(0, len(points), chunk):
+            stop = min(begin + chunk, len(points))
+            sub_start, sub_stop = max(begin, start), min(stop, end)
+            if sub_start >= sub_stop:
+                continue
+            aim_weights = share_density(begin, stop, lower, frac)
+            sub_weights[sub_start:sub_stop] = aim_weights[
+                pt_select[sub_start - start : sub_stop - start],
+                np.arange(sub_start, sub_stop) - begin,
+            ]
+        info = {
+            "populations": populations,
+            "n_iter": n_iter,
+            "converged": bool(change < tol),
+            "change": change,
+            "time": perf_counter() - start_time,
+        }
+        return sub_weights, info
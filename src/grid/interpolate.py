@@ -8,9 +8,54 @@ from scipy.interpolate import CubicSpline
 from scipy.special import sph_harm
 
 
+def lm_index(l_value, m_value):
+    """Get the index of (l, m) in the compact spherical harmonics layout.
+
+    Spherical harmonics are stored by increasing l and, for each l, by m from
+    -l to l, so (l, m) is at index l ** 2 + l + m.
+
+    Parameters
+    ----------
+    l_value : int or np.ndarray
+        angular degree
+    m_value : int or np.ndarray
+        order, with -l <= m <= l
+
+    Returns
+    -------
+    int or np.ndarray
+        index of (l, m) in compact layout
+    """
+    return l_value ** 2 + l_value + m_value
+
+
+def lm_pairs(l_max):
+    """Get degree and order of each index in the compact spherical harmonics layout.
+
+    Parameters
+    ----------
+    l_max : int
+        largest angular degree
+
+    Returns
+    -------
+    tuple(np.ndarray((l_max + 1) ** 2,), np.ndarray((l_max + 1) ** 2,))
+        l = [0, 1, 1, 1, 2, ...] and m = [0, -1, 0, 1, -2, ...]
+    """
+    l_list = np.repeat(np.arange(l_max + 1), 2 * np.arange(l_max + 1) + 1)
+    m_list = np.arange((l_max + 1) ** 2) - l_list ** 2 - l_list
+    return l_list, m_list
+
+
 def generate_real_sph_harms(l_max, theta, phi):
     """Generate real spherical harmonics.
 
+    The normalized associated Legendre functions are computed with the three
+    term recursion in l for all m at once, and cos(m theta) and sin(m theta)
+    with the angle addition formulas. For m > 0 (m < 0), the real harmonics
+    are the real (imaginary) parts of the complex harmonics, times sqrt(2),
+    with the signs of generate_sph_harms.
+
     Parameters
     ----------
     l_max : int
@@ -22,11 +67,114 @@ def generate_real_sph_harms(l_max, theta, phi):
 
     Returns
     -------
-    np.ndarray(l_max * 2 + 1, l_max + 1, N)
-        value of angular grid in each m, n sperical harmonics
+    np.ndarray((l_max + 1) ** 2, N)
+        value of real spherical harmonics, (l, m) at index lm_index(l, m)
+    """
+    return _real_sph_harms(l_max, theta, phi)
+
+
+def generate_real_sph_harms_deriv(l_max, theta, phi):
+    """Generate angular derivatives of real spherical harmonics.
+
+    Both derivatives are finite at the poles, where the gradient of a
+    function on the unit sphere is (d/dphi) phi_hat + (1 / sin(phi)) (d/dtheta)
+    theta_hat.
+
+    Parameters
+    ----------
+    l_max : int
+        largest angular degree
+    theta : np.ndarray(N,)
+        Azimuthal angles
+    phi : np.ndarray(N,)
+        Polar angles
+
+    Returns
+    -------
+    np.ndarray(2, (l_max + 1) ** 2, N)
+        derivative of real spherical harmonics to polar angle and derivative
+        to azimuthal angle divided by sin(phi), see generate_real_sph_harms
     """
-    sph_h = generate_sph_harms(l_max, theta, phi)
-    return np.nan_to_num(_convert_ylm_to_zlm(sph_h))
+    return _real_sph_harms(l_max, theta, phi, deriv=True)[1]
+
+
+def _real_sph_harms(l_max, theta, phi, deriv=False):
+    """Compute real spherical harmonics and their angular derivatives.
+
+    For m > 0, the recursion is done for the associated Legendre functions
+    divided by sin(phi), which gives the derivatives without dividing by
+    sin(phi).
+
+    Parameters
+    ----------
+    l_max : int
+        largest angular degree
+    theta : np.ndarray(N,)
+        Azimuthal angles
+    phi : np.ndarray(N,)
+        Polar angles
+    deriv : bool, default to False
+        Whether to compute the angular derivatives
+
+    Returns
+    -------
+    np.ndarray((l_max + 1) ** 2, N) or tuple
+        real spherical harmonics, and if deriv, their derivatives of shape
+        (2, (l_max + 1) ** 2, N), see generate_real_sph_harms_deriv
+    """
+    theta = np.asarray(theta, dtype=float)
+    z, s = np.cos(phi), np.sin(phi)
+    # cos(m theta) and sin(m theta) for m = 0, ..., l_max
+    cos_m = np.empty((l_max + 1, theta.size))
+    sin_m = np.empty((l_max + 1, theta.size))
+    cos_m[0], sin_m[0] = 1, 0
+    if l_max > 0:
+        cos_m[1], sin_m[1] = np.cos(theta), np.sin(theta)
+    for m in range(2, l_max + 1):
+        cos_m[m] = cos_m[m - 1] * cos_m[1] - sin_m[m - 1] * sin_m[1]
+        sin_m[m] = sin_m[m - 1] * cos_m[1] + cos_m[m - 1] * sin_m[1]
+    # sqrt(2) and signs of the real combinations of complex harmonics
+    cos_m[1:] *= np.sqrt(2) * (-1.0) ** np.arange(1, l_max + 1)[:, None]
+    sin_m[1:] *= -np.sqrt(2)
+    sph_harm = np.empty(((l_max + 1) ** 2, theta.size))
+    if deriv:
+        d_phi, d_theta = np.zeros((2, (l_max + 1) ** 2, theta.size))
+    # normalized associated legendre functions of last three degrees, for
+    # m > 0 divided by sin(phi)
+    p_new, p_old, p_older = np.empty((3, l_max + 1, theta.size))
+    p_new[0] = 1 / np.sqrt(4 * np.pi)
+    sph_harm[0] = p_new[0]
+    for deg in range(1, l_max + 1):
+        p_older, p_old, p_new = p_old, p_new, p_older
+        m = np.arange(deg - 1)[:, None]
+        a = np.sqrt((4 * deg ** 2 - 1) / (deg ** 2 - m ** 2))
+        b = np.sqrt(((deg - 1) ** 2 - m ** 2) / (4 * (deg - 1) ** 2 - 1))
+        p_new[: deg - 1] = a * (z * p_old[: deg - 1] - b * p_older[: deg - 1])
+        p_new[deg - 1] = np.sqrt(2 * deg + 1) * z * p_old[deg - 1]
+        p_new[deg] = np.sqrt((2 * deg + 1) / (2 * deg)) * p_old[deg - 1]
+        if deg > 1:
+            p_new[deg] *= s
+        center, pos = deg ** 2 + deg, slice(1, deg + 1)
+        q_cos, q_sin = p_new[pos] * cos_m[pos], p_new[pos] * sin_m[pos]
+        sph_harm[center] = p_new[0]
+        sph_harm[center + 1 : center + deg + 1] = s * q_cos
+        sph_harm[center - deg : center] = (s * q_sin)[::-1]
+        if deriv:
+            m = np.arange(1, deg + 1)[:, None]
+            # (1 / sin(phi)) d/dtheta mixes (l, m) and (l, -m)
+            sign = m * (-1.0) ** m
+            d_theta[center + 1 : center + deg + 1] = sign * q_sin
+            d_theta[center - deg : center] = (-sign * q_cos)[::-1]
+            # d/dphi of legendre functions from degree l and l - 1
+            e = np.sqrt((2 * deg + 1) / (2 * deg - 1) * (deg - m[:-1]) * (deg + m[:-1]))
+            dq = deg * z * p_new[pos]
+            dq[:-1] -= e * p_old[1:deg]
+            d_phi[center] = -np.sqrt(deg * (deg + 1)) * s * p_new[1]
+            d_phi[center + 1 : center + deg + 1] = dq * cos_m[pos]
+            d_phi[center - deg : center] = (dq * sin_m[pos])[::-1]
+    if deriv:
+        return sph_harm, np.array([d_phi, d_theta])
+    return sph_harm
 
 
 def generate_sph_harms(l_max, theta, phi):
@@ -89,37 +237,183 @@ def _convert_ylm_to_zlm(sp_harm_arrs):
     return s_h_r
 
 
+def project_sph_harms(projector, value_arrays, indices):
+    """Project functions on real spherical harmonics on each radial shell.
+
+    Consecutive shells with the same number of points are projected together
+    with one batched matrix product.
+
+    Parameters
+    ----------
+    projector : np.ndarray(L, N)
+        real spherical harmonics values of L (l, m) pairs times the weights of
+        each point on the grid
+    value_arrays : np.ndarray(N,) or np.ndarray(K, N)
+        fuction values on each point, of one or K functions
+    indices : list[int]
+        indices of each chank for each radial angular partsption
+
+    Returns
+    -------
+    np.ndarray(R, L) or np.ndarray(R, K, L)
+        projection of each function on each real spherical harmonics on each
+        of the R radial shells
+    """
+    value_arrays = np.asarray(value_arrays)
+    values = value_arrays.reshape(-1, projector.shape[-1])
+    sizes = np.diff(indices)
+    table = np.empty((len(sizes), len(values), len(projector)))
+    bounds = np.concatenate([[0], np.flatnonzero(np.diff(sizes)) + 1, [len(sizes)]])
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        n_shells, block = end - start, slice(indices[start], indices[end])
+        # (S, K, n) x (S, n, L) product of S shells of n points
+        sub_values = values[:, block].reshape(len(values), n_shells, -1)
+        sub_proj = projector[:, block].reshape(len(projector), n_shells, -1)
+        np.matmul(
+            sub_values.transpose(1, 0, 2),
+            sub_proj.transpose(1, 2, 0),
+            out=table[start:end],
+        )
+    return table.reshape((len(sizes),) + value_arrays.shape[:-1] + (len(projector),))
+
+
 def spline_with_sph_harms(sph_harm, value_arrays, weights, indices, radial):
     """Compute spline with real spherical harmonics.
 
+    Many functions on the same grid are decomposed together, see
+    project_sph_harms.
+
     Parameters
     ----------
-    sph_harm : np.ndarray(M, L, N, N)
-        spherical harmonics values of m, l, theta, phi
-    value_arrays : np.ndarray(N,)
-        fuction values on each point
+    sph_harm : np.ndarray(L, N)
+        real spherical harmonics values of L = (l_max + 1) ** 2 (l, m) pairs
+    value_arrays : np.ndarray(N,) or np.ndarray(K, N)
+        fuction values on each point, of one or K functions
     weights : np.ndarray(N,)
         weights of each point on the grid
     indices : list[int]
         indices of each chank for each radial angular partsption
-    radial : np.ndarray(K,)
+    radial : np.ndarray(R,)
         radial coordinates of atomic grid
 
     Returns
     -------
     scipy.CubicSpline
-        CubicSpline object for interpolating values
+        CubicSpline object for interpolating values, of shape (L,) or (K, L)
+        on each radial coordinate
     """
-    prod_value = sph_harm * value_arrays * weights
-    total = len(indices) - 1
-    axis_value = []
-    for i in range(total):
-        sum_i = np.sum(prod_value[:, :, indices[i] : indices[i + 1]], axis=-1)
-        axis_value.append(sum_i)
-    ml_sph_value = np.nan_to_num(np.stack(axis_value))
+    ml_sph_value = project_sph_harms(sph_harm * weights, value_arrays, indices)
     return CubicSpline(x=radial, y=ml_sph_value)
 
 
+def eval_sph_harm_expansion(spline, points, deriv=0):
+    r"""Evaluate spherical harmonics expansion and its derivatives on points.
+
+    The expansion is f(r) = sum_lm c_lm(|r|) Y_lm(r / |r|), with the radial
+    coefficients clipped to the first and last radial point. The gradient is
+    computed from the radial derivatives of the coefficients and the angular
+    derivatives of the spherical harmonics, the Laplacian from
+
+    .. math::
+        \nabla^2 f = \sum_{lm} \left(c_{lm}'' + \frac{2}{r} c_{lm}' -
+        \frac{l(l + 1)}{r^2} c_{lm}\right) Y_{lm}
+
+    Parameters
+    ----------
+    spline : scipy.CubicSpline
+        Spline of expansion coefficients of shape (L,) or (F, L) on each
+        radial point
+    points : np.ndarray(N, 3)
+        Cartesian coordinates relative to the center of the expansion
+    deriv : int, default to 0
+        0 for values, 1 for gradients and 2 for Laplacians
+
+    Returns
+    -------
+    np.ndarray(N,) or np.ndarray(N, 3)
+        Values, gradients or Laplacians on each point, with an extra axis
+        (F,) first for F functions
+
+    Raises
+    ------
+    ValueError
+        deriv is not 0, 1 or 2
+    """
+    if deriv not in [0, 1, 2]:
+        raise ValueError(f"deriv should be 0, 1 or 2, got {deriv}")
+    r = np.linalg.norm(points, axis=1)
+    cos_phi = np.divide(points[:, 2], r, out=np.ones_like(r), where=r > 0)
+    theta = np.arctan2(points[:, 1], points[:, 0])
+    phi = np.arccos(np.clip(cos_phi, -1, 1))
+    l_max = int(np.sqrt(spline.c.shape[-1])) - 1
+    r = np.clip(r, spline.x[0], spline.x[-1])
+    coeffs = spline(r)
+    if deriv == 0:
+        sph_harm = generate_real_sph_harms(l_max, theta, phi)
+        return np.einsum("n...l,ln->...n", coeffs, sph_harm)
+    d_coeffs = spline.derivative()(r)
+    r_col = r.reshape((-1,) + (1,) * (coeffs.ndim - 1))
+    if deriv == 2:
+        sph_harm = generate_real_sph_harms(l_max, theta, phi)
+        l_list = lm_pairs(l_max)[0]
+        lap_coeffs = spline.derivative(2)(r) + 2 * d_coeffs / r_col
+        lap_coeffs -= l_list * (l_list + 1) * coeffs / r_col ** 2
+        return np.einsum("n...l,ln->...n", lap_coeffs, sph_harm)
+    sph_harm, (d_phi, d_theta) = _real_sph_harms(l_max, theta, phi, deriv=True)
+    sin_phi = np.sin(phi)
+    cos_theta, sin_theta = np.cos(theta), np.sin(theta)
+    # unit vectors of spherical coordinates
+    r_hat = np.array([sin_phi * cos_theta, sin_phi * sin_theta, cos_phi]).T
+    phi_hat = np.array([cos_phi * cos_theta, cos_phi * sin_theta, -sin_phi]).T
+    theta_hat = np.array([-sin_theta, cos_theta, np.zeros_like(r)]).T
+    grad_r = np.einsum("n...l,ln->...n", d_coeffs, sph_harm)
+    grad_phi = np.einsum("n...l,ln->...n", coeffs / r_col, d_phi)
+    grad_theta = np.einsum("n...l,ln->...n", coeffs / r_col, d_theta)
+    return (
+        grad_r[..., None] * r_hat
+        + grad_phi[..., None] * phi_hat
+        + grad_theta[..., None] * theta_hat
+    )
+
+
+def eval_sph_harm_expansion_bytes(n_sph_harms, n_funcs=1, deriv=0):
+    """Estimate the scratch memory of eval_sph_harm_expansion for each point.
+
+    Counts the arrays allocated by eval_sph_harm_expansion and
+    _real_sph_harms, and needs to be updated with them.
+
+    Parameters
+    ----------
+    n_sph_harms : int
+        Number L of spherical harmonics of the expansion, (l_max + 1) ** 2
+    n_funcs : int, default to 1
+        Number F of expanded functions
+    deriv : int, default to 0
+        0 for values, 1 for gradients and 2 for Laplacians
+
+    Returns
+    -------
+    int
+        Scratch memory (in bytes) for each point
+    """
+    l_max = int(np.sqrt(n_sph_harms)) - 1
+    # (F, L) coefficients, for deriv 1 with radial derivatives and the two
+    # divided by r, for deriv 2 with first and second radial derivatives,
+    # their sum and a temporary
+    n_coeffs = [1, 4, 5][deriv]
+    # (L,) spherical harmonics, for deriv 1 with both angular derivatives,
+    # also stacked into one array
+    n_harms = [1, 5, 1][deriv]
+    # (l_max + 1,) cos(m theta), sin(m theta), three legendre degrees and
+    # temporaries of the recursion
+    n_recursion = 9 * (l_max + 1)
+    # radius, clipped radius, angles, cosine and sine of the polar angle and
+    # results, for deriv 1 also three unit vectors, three (F,) gradient
+    # components and their (F, 3) products
+    n_values = [6 + n_funcs, 15 + 12 * n_funcs, 6 + n_funcs][deriv]
+    return 8 * (n_sph_harms * (n_coeffs * n_funcs + n_harms) + n_recursion + n_values)
+
+
 def interpelate(spline, r_points, theta, phi):
     """Interpolate angular points on given r value.
 
@@ -137,19 +431,15 @@ def interpelate(spline, r_points, theta, phi):
     Returns
     -------
     np.ndarry(N,) or np.ndarray(n, N)
-        Interpolated function value at spherical grid
+        Interpolated function value at spherical grid, with an extra axis
+        (K,) before N for a spline of K functions
     """
     r_value = spline(r_points)
-    l_max = r_value.shape[-1] - 1
+    l_max = int(np.sqrt(r_value.shape[-1])) - 1
     r_sph_harm = generate_real_sph_harms(l_max, theta, phi)
-    # single value interpolation
-    if isinstance(r_points, (int, np.integer)):
-        return np.sum(r_sph_harm * r_value[..., None], axis=(0, 1)) / (r_points ** 2)
-    # intepolate for multiple values
-    else:
-        # convert to np.array if list
-        r_points = np.array(r_points)
-        return (
-            np.sum(r_sph_harm * r_value[..., None], axis=(-3, -2))
-            / (r_points ** 2)[:, None]
-        )
+    values = r_value @ r_sph_harm
+    # convert to np.array if list
+    r_points = np.array(r_points)
+    return values / (r_points ** 2).reshape(
+        r_points.shape + (1,) * (values.ndim - r_points.ndim)
+    )
@@ -1,8 +1,11 @@
 """Generate Lebedev grid."""
 
+import threading
 import warnings
+from itertools import product
 
 from grid.basegrid import AngularGrid
+from grid.utils import LRUCache
 
 from importlib_resources import path
 
@@ -78,12 +81,101 @@ n_degree = [
     131,
 ]
 
+_degree_array = np.array(n_degree)
+_size_array = np.array(n_points)
+
+# process-wide LRU cache of generated grids, keyed by (degree, size)
+_cache = LRUCache(maxsize=len(n_degree))
+
+# memory-mapped orbit generators of all grids, loaded on first use
+_orbits = None
+_orbits_lock = threading.Lock()
+
+
+def _signed_perms(perms, signs, sign_major=False):
+    """Construct signed permutations of an orbit from generator sign flips.
+
+    Parameters
+    ----------
+    perms : list[tuple(int, int, int)]
+        Permutations of the generator components
+    signs : list[tuple(int, int, int)]
+        Sign flips of the generator components, before permutation
+    sign_major : bool, default to False
+        Whether the signs change slowest in the order of orbit points
+
+    Returns
+    -------
+    tuple(np.ndarray(K, 3), np.ndarray(K, 3)), permutations and signs such
+    that orbit point k is signs[k] * generator[perms[k]].
+    """
+    if sign_major:
+        pairs = [(perm, sign) for sign in signs for perm in perms]
+    else:
+        pairs = [(perm, sign) for perm in perms for sign in signs]
+    perms = np.array([perm for perm, _ in pairs])
+    # flip signs of generator components, i.e. after permutation
+    signs = np.array([np.array(sign)[list(perm)] for perm, sign in pairs], float)
+    return perms, signs
+
+
+# orbits of octahedral symmetry, points of orbit k are
+# signs[k] * generator[perms[k]] in the order of the lebedev-laikov rules
+_orbit_ops = {
+    # a1: (1, 0, 0), 6 points
+    1: _signed_perms([(0, 1, 2), (1, 0, 2), (1, 2, 0)], [(1, 1, 1), (-1, 1, 1)]),
+    # a2: (a, a, 0), 12 points
+    2: _signed_perms(
+        [(0, 1, 2), (0, 2, 1), (2, 0, 1)],
+        [(1, 1, 1), (1, -1, 1), (-1, 1, 1), (-1, -1, 1)],
+    ),
+    # a3: (a, a, a), 8 points
+    3: _signed_perms([(0, 1, 2)], list(product([1, -1], repeat=3))),
+    # bk: (a, a, b), 24 points
+    4: _signed_perms(
+        [(0, 1, 2), (0, 2, 1), (2, 0, 1)],
+        [tuple(sign[::-1]) for sign in product([1, -1], repeat=3)],
+    ),
+    # ck: (a, b, 0), 24 points, signs flip the two non-zero output components
+    5: (
+        np.repeat(
+            [(0, 1, 2), (1, 0, 2), (0, 2, 1), (1, 2, 0), (2, 0, 1), (2, 1, 0)], 4, 0
+        ),
+        np.array(
+            [
+                sign[:slot] + (1,) + sign[slot:]
+                for slot in [2, 2, 1, 1, 0, 0]
+                for sign in [(1, 1), (-1, 1), (-1, -1), (1, -1)]
+            ],
+            float,
+        ),
+    ),
+    # dk: (a, b, c), 48 points
+    6: _signed_perms(
+        [(0, 1, 2), (2, 0, 1), (1, 2, 0), (1, 0, 2), (2, 1, 0), (0, 2, 1)],
+        [
+            (1, 1, 1),
+            (-1, 1, 1),
+            (1, -1, 1),
+            (1, 1, -1),
+            (-1, -1, 1),
+            (-1, 1, -1),
+            (1, -1, -1),
+            (-1, -1, -1),
+        ],
+        sign_major=True,
+    ),
+}
+
 
 def generate_lebedev_grid(*, degree=None, size=None):
     """Generate lebedev grid for given degree or size.
 
     Either degree or size is needed to generate proper grid. If both provided,
-    degree will be used instead of size.
+    degree will be used instead of size. Grids are generated from the
+    generators of their octahedral orbits and kept in a process-wide LRU
+    cache, so the points and weights of the returned grid are read-only arrays
+    shared by all grids of the same type.
 
     Parameters
     ----------
@@ -98,9 +190,43 @@ def generate_lebedev_grid(*, degree=None, size=None):
         An AngularGrid instance with points and weights.
     """
     degree, size = _select_grid_type(degree=degree, size=size)
-    points, weights = _load_grid_arrays(_load_grid_filename(degree, size))
-    # set weights to 4\pi
-    return AngularGrid(points, weights * 4 * np.pi)
+    points, weights = _load_cached_grid_arrays(degree, size)
+    return AngularGrid(points, weights)
+
+
+def lebedev_cache_info():
+    """Get statistics of the lebedev grid cache.
+
+    Returns
+    -------
+    CacheInfo
+        Named tuple of hits, misses, maxsize and currsize of the cache
+    """
+    return _cache.info()
+
+
+def clear_lebedev_cache():
+    """Remove all grids from the lebedev grid cache and reset its statistics."""
+    _cache.clear()
+
+
+def resize_lebedev_cache(maxsize):
+    """Set the largest number of grids kept in the lebedev grid cache.
+
+    Least recently used grids beyond maxsize are removed.
+
+    Parameters
+    ----------
+    maxsize : int or None
+        Largest number of cached grids. If None, the cache is unbounded, if
+        0, no grid is cached.
+
+    Raises
+    ------
+    ValueError
+        maxsize is negative
+    """
+    _cache.resize(maxsize)
 
 
 def match_degree(degree_nums):
@@ -116,7 +242,7 @@ def match_degree(degree_nums):
     np.ndarray[int]
         An array of proper angular degree values
     """
-    return np.array([_select_grid_type(degree=i)[0] for i in degree_nums], dtype=int)
+    return _select_grid_types(degrees=degree_nums)[0]
 
 
 def _select_grid_type(*, degree=None, size=None):
@@ -155,8 +281,46 @@ def _select_grid_type(*, degree=None, size=None):
         )
 
 
-def _load_grid_filename(degree: int, size: int):
-    """Construct lebedev file name for given degree and size.
+def _select_grid_types(*, degrees=None, sizes=None):
+    """Select proper lebedev grid schemes for arrays of degrees or sizes.
+
+    Batched version of _select_grid_type, with ranges validated once.
+
+    Parameters
+    ----------
+    degrees : array_like of int, the magic numbers for spherical grids
+    sizes : array_like of int, the numbers of points for spherical grids
+
+    Returns
+    -------
+    tuple(np.ndarray(N,), np.ndarray(N,)), proper magic numbers and their
+    correspounding numbers of points.
+    """
+    if degrees is not None and sizes is not None:
+        warnings.warn(
+            "Both degrees and sizes are provided, will use degrees only",
+            RuntimeWarning,
+        )
+    if degrees is not None:
+        values, table, name = np.asarray(degrees), _degree_array, "degree"
+    elif sizes is not None:
+        values, table, name = np.asarray(sizes), _size_array, "size"
+    else:
+        raise ValueError(
+            "Please provide 'degrees' or 'sizes' to define grid types in arguments"
+        )
+    if values.size and (np.min(values) <= 0 or np.max(values) > table[-1]):
+        raise ValueError(
+            f"'{name}' needs to be positive integers <= {table[-1]}, got "
+            f"{np.min(values)} to {np.max(values)}"
+        )
+    # first grid with degree (size) not smaller than the given one
+    index = np.searchsorted(table, values, side="left")
+    return _degree_array[index], _size_array[index]
+
+
+def _load_cached_grid_arrays(degree, size):
+    """Get lebedev points and weights through the lebedev grid cache.
 
     Parameters
     ----------
@@ -165,22 +329,84 @@ def _load_grid_filename(degree: int, size: int):
 
     Returns
     -------
-    str, file name for given type of lebedev grid
+    tuple(np.ndarray(N, 3), np.ndarray(N,)), read-only coordinates and
+    weights (summing to 4 pi) of grid.
     """
-    return f"lebedev_{degree}_{size}.npz"
+
+    def generate():
+        points, weights = _generate_lebedev_arrays(degree, size)
+        points.flags.writeable = False
+        weights.flags.writeable = False
+        return points, weights
+
+    return _cache.get((degree, size), generate)
 
 
-def _load_grid_arrays(filename):
-    """Load .npz presaved file to generate lebedev points.
+def _load_orbits():
+    """Memory-map the orbit generators of all lebedev grids on first use.
+
+    Each row of the table (lebedev_orbits.npy, see
+    tools/make_lebedev_orbits.py) is [grid index in n_degree, orbit type,
+    generator x, y, z, weight], for all orbits of a grid in the order of its
+    points. The file is memory-mapped read-only, so the generators of each
+    grid are zero-copy views into it and worker processes share its pages
+    through the page cache.
+
+    Returns
+    -------
+    np.ndarray(K, 6), read-only memory-mapped orbit generators of all grids.
+
+    Raises
+    ------
+    ValueError
+        The table does not match the lebedev grid sizes.
+    """
+    global _orbits
+    with _orbits_lock:
+        if _orbits is None:
+            with path("grid.data.lebedev", "lebedev_orbits.npy") as npy_file:
+                orbits = np.load(npy_file, mmap_mode="r")
+            orbit_sizes = np.array([0] + [len(_orbit_ops[i][0]) for i in range(1, 7)])
+            sizes = np.bincount(
+                orbits[:, 0].astype(int),
+                weights=orbit_sizes[orbits[:, 1].astype(int)],
+                minlength=len(n_points),
+            )
+            if not np.array_equal(sizes, n_points):
+                raise ValueError("Lebedev orbits do not match the lebedev grid sizes.")
+            _orbits = orbits.view(np.ndarray)
+        return _orbits
+
+
+def _generate_lebedev_arrays(degree, size):
+    """Generate lebedev points and weights from orbit generators.
 
     Parameters
     ----------
-    filename : str or Path
+    degree : int
+    size : int
 
     Returns
     -------
-    tuple(np.ndarray(N,), np.ndarray(N,)), the coordinates and weights of grid.
+    tuple(np.ndarray(N, 3), np.ndarray(N,)), the coordinates and weights
+    (summing to 4 pi) of grid.
     """
-    with path("grid.data.lebedev", filename) as npz_file:
-        data = np.load(npz_file)
-    return data["points"], data["weights"]
+    orbits = _load_orbits()
+    index = n_degree.index(degree)
+    # orbits are sorted by grid index, slice a view of the memory map
+    orbits = orbits[slice(*np.searchsorted(orbits[:, 0], [index, index + 1]))]
+    points = np.empty((size, 3))
+    weights = np.empty(size)
+    start = 0
+    for orbit_type, (perms, signs) in _orbit_ops.items():
+        # expand all orbits of one type at once, generators change fastest
+        generators = orbits[orbits[:, 1] == orbit_type]
+        stop = start + len(perms) * len(generators)
+        points[start:stop] = (
+            signs[:, None] * generators[:, 2:5][:, perms].transpose(1, 0, 2)
+        ).reshape(-1, 3)
+        weights[start:stop] = np.tile(generators[:, 5] * 4 * np.pi, len(perms))
+        start = stop
+    # avoid negative zeros from sign flips
+    points += 0.0
+    return points, weights
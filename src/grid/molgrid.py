@@ -1,15 +1,40 @@
 """Molecular grid class."""
+import copy
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
 # from grid.atomic_grid import AtomicGrid
 from grid.basegrid import Grid, SimpleAtomicGrid
-from grid.becke import BeckeWeights
+from grid.becke import AtomPairTable, BeckeWeights, SSFWeights
+from grid.hirshfeld import HirshfeldWeights
+from grid.interpolate import eval_sph_harm_expansion, eval_sph_harm_expansion_bytes
+from grid.utils import get_chunk_size
 
 import numpy as np
 
+from scipy.spatial import cKDTree
+
+# multiprocessing.shared_memory is only available for python >= 3.8
+_HAS_SHARED_MEMORY = sys.version_info >= (3, 8)
+
 
 class MolGrid(Grid):
     """Molecular Grid for integration."""
 
-    def __init__(self, atomic_grids, radii, aim_weights="becke", store=False):
+    def __init__(
+        self,
+        atomic_grids,
+        radii,
+        aim_weights="becke",
+        store=False,
+        *,
+        max_memory=2 ** 30,
+        n_workers=1,
+        executor=None,
+        screen_tol=None,
+        proatoms=None,
+        density=None,
+    ):
         """Initialize molgrid class.
 
         Parameters
@@ -21,6 +46,52 @@ class MolGrid(Grid):
         aim_weights : str or np.ndarray(K,), default to "becke"
             Atoms in molecule weights. If str, certain function will be called
             to compute aim_weights, if np.ndarray, it will be treated as the
+            aim_weights. Supported str are "becke" (Becke weights with radii
+            adjustment), "ssf" (Stratmann-Scuseria-Frisch weights, radii
+            are not used), "hirshfeld" (Hirshfeld weights of proatoms) and
+            "hirshfeld-i" (iterative Hirshfeld weights of proatoms and
+            density)
+        store : bool, default to False
+            Whether to keep the atomic grids for indexing. Stored atomic grids
+            keep their translated points once these are read. Otherwise,
+            copies sharing only the centred arrays of the atomic grids are
+            kept for interpolation, so the memory does not grow with the
+            translated points of each atom.
+        max_memory : int or None, default to 2 ** 30, keyword-only argument
+            Upper bound (in bytes) of the scratch memory used when computing
+            aim_weights. If None, all points are computed in one block.
+        n_workers : int, default to 1, keyword-only argument
+            Number of processes used for computing aim_weights. If larger
+            than 1, the aim_weights of each atom are computed in a process
+            pool. Points and aim_weights are passed in shared memory, which
+            needs Python >= 3.8. On older versions, the points of each atom
+            are pickled instead. The result does not depend on n_workers.
+        executor : concurrent.futures.Executor, optional, keyword-only argument
+            Executor used for computing the aim_weights of each atom instead
+            of a new process pool of n_workers processes, e.g. a pool shared
+            by several molecular grids. The executor is not shut down.
+        screen_tol : float, optional, keyword-only argument
+            If given, "becke" aim_weights only evaluate the cell functions of
+            atoms near each point, see BeckeWeights.generate_becke_weights.
+            The aim_weights then differ from the exact ones by up to about
+            100 times screen_tol. Ignored for other aim_weights.
+        proatoms : list[tuple], optional, keyword-only argument
+            Radial pro-atom density of each atom, needed for "hirshfeld" and
+            "hirshfeld-i" aim_weights. For "hirshfeld", each entry is (r, rho)
+            with radial points r of shape (R,) and density rho of shape (R,).
+            For "hirshfeld-i", each entry is (r, rhos, populations) with
+            densities rhos of shape (P, R) of pro-atoms with the increasing
+            populations of shape (P,). Atoms sharing the same entry object
+            (e.g. of the same element) share one spline.
+        density : np.ndarray(K,), optional, keyword-only argument
+            Molecular density on each point, needed for "hirshfeld-i"
+            aim_weights. The populations of the iteration are integrated
+            with Becke aim_weights.
+
+        Raises
+        ------
+        ValueError
+            proatoms or density are missing or of wrong size for Hirshfeld
             aim_weights
         """
         # initialize these attributes
@@ -29,23 +100,68 @@ class MolGrid(Grid):
         self._size = np.sum([atomgrid.size for atomgrid in atomic_grids])
         self._points = np.zeros((self._size, 3))
         self._weights = np.zeros(self._size)
-        self._atomic_grids = atomic_grids if store else None
+        # kept for interpolation, atoms of one element share the grid arrays
+        self._atomic_grids = [
+            atom_grid if store else _copy_without_moved_points(atom_grid)
+            for atom_grid in atomic_grids
+        ]
+        self._store = store
+        self._radii = radii
+        self._max_memory = max_memory
+        self._n_workers = n_workers
+        self._executor = executor
+        self._screen_tol = screen_tol
+        self._aim_type = aim_weights if isinstance(aim_weights, str) else None
+        self._splines = None
+        self._aim_info = None
 
         for i, atom_grid in enumerate(atomic_grids):
             self._coors[i] = atom_grid.center
             self._indices[i + 1] += self._indices[i] + atom_grid.size
-            self._points[self._indices[i] : self._indices[i + 1]] = atom_grid.points
+            atom_points = self._points[self._indices[i] : self._indices[i + 1]]
+            if hasattr(atom_grid, "get_points"):
+                atom_grid.get_points(out=atom_points)
+            else:
+                # e.g. SimpleAtomicGrid of another molecular grid
+                atom_points[:] = atom_grid.points
             self._weights[self._indices[i] : self._indices[i + 1]] = atom_grid.weights
+        self._pair_table = AtomPairTable(self._coors, radii)
 
         if isinstance(aim_weights, str):
-            if aim_weights == "becke":
-                self._aim_weights = BeckeWeights.generate_becke_weights(
-                    self._points, radii, self._coors, pt_ind=self._indices
-                )
-            else:
+            if aim_weights not in ["becke", "ssf", "hirshfeld", "hirshfeld-i"]:
                 raise NotImplementedError(
                     f"Given aim_weights is not supported, got {aim_weights}"
                 )
+            if aim_weights.startswith("hirshfeld"):
+                if proatoms is None or len(proatoms) != len(radii):
+                    raise ValueError(
+                        f"{len(radii)} proatoms are needed for {aim_weights} "
+                        "aim_weights."
+                    )
+                self._splines = HirshfeldWeights.spline_proatoms(proatoms)
+            if aim_weights == "hirshfeld-i":
+                if density is None or np.size(density) != self.size:
+                    raise ValueError(
+                        f"density of size {self.size} is needed for hirshfeld-i "
+                        "aim_weights."
+                    )
+                # populations are integrated with becke molecular weights
+                mol_weights = self._weights * self._generate_aim_weights(
+                    "becke", n_workers
+                )
+                weights, info = HirshfeldWeights.generate_iterative_hirshfeld_weights(
+                    self._points,
+                    mol_weights,
+                    np.ravel(density),
+                    self._coors,
+                    self._splines,
+                    [proatom[2] for proatom in proatoms],
+                    pt_ind=self._indices,
+                    max_memory=max_memory,
+                )
+                self._aim_weights, self._aim_info = weights, info
+            else:
+                self._aim_weights = self._generate_aim_weights(aim_weights, n_workers)
         elif isinstance(aim_weights, np.ndarray):
             if aim_weights.size != self.size:
                 raise ValueError(
@@ -57,6 +173,148 @@ class MolGrid(Grid):
         else:
             raise TypeError(f"Not supported aim_weights type, got {type(aim_weights)}.")
 
+    def _generate_aim_weights(self, method, n_workers=1, atoms=None):
+        """Compute aim_weights of each atomic grid.
+
+        Parameters
+        ----------
+        method : str
+            Method of aim_weights, "becke", "ssf" or "hirshfeld"
+        n_workers : int, default to 1
+            Number of processes used for computing aim_weights, ignored if the
+            molecular grid has an executor
+        atoms : np.ndarray(L,), optional
+            Indices of atoms whose aim_weights are computed, default to all
+
+        Returns
+        -------
+        np.ndarray(K,)
+            Atom in molecule weights for each point, zero for points of atoms
+            not in atoms
+        """
+        if atoms is None:
+            atoms = np.arange(len(self._coors))
+        if n_workers > 1 or self._executor is not None:
+            return _generate_parallel_aim_weights(
+                method,
+                self._points,
+                self._pair_table,
+                self._indices,
+                self._max_memory,
+                n_workers,
+                atoms,
+                self._splines,
+                self._executor,
+                self._screen_tol,
+            )
+        aim_weights = np.zeros(self.size)
+        for i in atoms:
+            s_ind, f_ind = self._indices[i], self._indices[i + 1]
+            aim_weights[s_ind:f_ind] = _generate_sector_aim_weights(
+                method,
+                self._points[s_ind:f_ind],
+                self._pair_table,
+                i,
+                self._max_memory,
+                self._splines,
+                self._screen_tol,
+            )
+        return aim_weights
+
+    def update_coordinates(self, new_coors, *, tol=None, cutoff=np.inf):
+        """Move the atomic grids to new atomic coordinates.
+
+        The points of each atomic grid are translated with its atom and only
+        the aim_weights are recomputed. Stored atomic grids are replaced by
+        moved copies, the atomic grids given to the constructor are not
+        changed. The aim_weights of an atomic grid
+        only depend on the positions of the other atoms relative to its own
+        atom, so with tol given, they are only recomputed for atoms where
+        such a relative displacement is larger than tol.
+
+        Parameters
+        ----------
+        new_coors : np.ndarray(N, 3)
+            New coordinates of each atom
+        tol : float, optional, keyword-only argument
+            Largest relative displacement of neighbouring atoms for which the
+            aim_weights of an atom are kept. If None, all aim_weights are
+            recomputed.
+        cutoff : float, default to np.inf, keyword-only argument
+            Only atoms closer than cutoff (before or after the update) are
+            taken as neighbours when tol is given. The aim_weights of an atom
+            are then approximate, as the displacement of farther atoms is
+            ignored.
+
+        Returns
+        -------
+        np.ndarray(L,)
+            Indices of atoms whose aim_weights are recomputed
+
+        Raises
+        ------
+        ValueError
+            Shape of new_coors does not match the number of atoms.
+        NotImplementedError
+            The aim_weights are given as an array or depend on the density
+            ("hirshfeld-i") and cannot be recomputed.
+        """
+        new_coors = np.array(new_coors, dtype=float)
+        if new_coors.shape != self._coors.shape:
+            raise ValueError(
+                f"new_coors need to be in shape {self._coors.shape}, "
+                f"got {new_coors.shape}."
+            )
+        if self._aim_type is None:
+            raise NotImplementedError(
+                "Given aim_weights array cannot be updated for new coordinates."
+            )
+        if self._aim_type == "hirshfeld-i":
+            raise NotImplementedError(
+                "hirshfeld-i aim_weights need the density of new coordinates."
+            )
+        shift = new_coors - self._coors
+        new_table = AtomPairTable(new_coors, self._radii)
+        if tol is None:
+            atoms = np.arange(len(new_coors))
+        else:
+            # displacement of each atom relative to the other atoms
+            rel_shift = np.linalg.norm(shift[:, None] - shift, axis=-1)
+            neighbour = (self._pair_table.dists < cutoff) | (new_table.dists < cutoff)
+            atoms = np.nonzero(np.any(neighbour & (rel_shift > tol), axis=1))[0]
+        for i, atom_shift in enumerate(shift):
+            self._points[self._indices[i] : self._indices[i + 1]] += atom_shift
+            if self._store:
+                # the given atomic grids may be used elsewhere, so move a copy
+                # sharing the same arrays
+                self._atomic_grids[i] = _copy_without_moved_points(
+                    self._atomic_grids[i]
+                )
+                self._atomic_grids[i].center = new_coors[i]
+        self._coors = new_coors
+        self._pair_table = new_table
+        if len(atoms) > 0:
+            aim_weights = self._generate_aim_weights(
+                self._aim_type, self._n_workers, atoms
+            )
+            for i in atoms:
+                s_ind, f_ind = self._indices[i], self._indices[i + 1]
+                self._aim_weights[s_ind:f_ind] = aim_weights[s_ind:f_ind]
+        return atoms
+
+    @property
+    def aim_info(self):
+        """dict: Iteration info of "hirshfeld-i" aim_weights, None for others.
+
+        Keys are "populations", "n_iter", "converged", "change" and "time".
+        """
+        return self._aim_info
+
+    @property
+    def pair_table(self):
+        """AtomPairTable: Atom pair quantities of the current coordinates."""
+        return self._pair_table
+
     @property
     def aim_weights(self):
         """np.ndarray(K,): Atom in molecule weights."""
@@ -96,6 +354,173 @@ class MolGrid(Grid):
             *(np.ravel(i) for i in value_arrays),
         )
 
+    def integrate_aim_weights_deriv(self, *value_arrays):
+        """Compute the aim weights contribution to the derivative of an integral.
+
+        The points of each atomic grid move together with its atom, so this is
+        the term of the nuclear gradient of the integral that comes from the
+        derivatives of the aim weights. The cell function products are
+        recomputed with their derivatives instead of being stored for all
+        points, so this costs about three to four times the computation of the
+        aim weights.
+
+        Parameters
+        ----------
+        *value_arrays, np.ndarray
+            Evaluated integrand on the grid
+
+        Returns
+        -------
+        np.ndarray(N, 3)
+            Derivative of the integral with respect to the coordinates of
+            each atom
+
+        Raises
+        ------
+        TypeError
+            Given value_arrays is not np.ndarray
+        ValueError
+            The size of the value_arrays does not match with grid size.
+        NotImplementedError
+            The aim_weights are not computed by becke method.
+        """
+        if self._aim_type != "becke":
+            raise NotImplementedError(
+                "Derivatives are only supported for becke aim_weights."
+            )
+        if len(value_arrays) < 1:
+            raise ValueError("No array is given to integrate.")
+        for i, array in enumerate(value_arrays):
+            if not isinstance(array, np.ndarray):
+                raise TypeError(f"Arg {i} is {type(i)}, Need Numpy Array.")
+            if array.size != self.size:
+                raise ValueError(f"Arg {i} need to be of shape {self.size}.")
+        integrand = self.weights.copy()
+        for array in value_arrays:
+            integrand *= np.ravel(array)
+        n_atoms = len(self._coors)
+        chunk = BeckeWeights._get_chunk_size(
+            n_atoms, self.size, max_memory=self._max_memory, n_arrays=8
+        )
+        deriv = np.zeros((n_atoms, 3))
+        for i in range(n_atoms):
+            for begin in range(self._indices[i], self._indices[i + 1], chunk):
+                stop = min(begin + chunk, self._indices[i + 1])
+                _, sub_deriv = BeckeWeights.generate_becke_weights_deriv(
+                    self._points[begin:stop],
+                    self._radii,
+                    self._coors,
+                    select=[i],
+                    moving_points=True,
+                    pair_table=self._pair_table,
+                )
+                deriv += np.einsum("p,pax->ax", integrand[begin:stop], sub_deriv)
+        return deriv
+
+    def spline_with_sph_harms(self, value_arrays, l_max=None):
+        """Compute spherical harmonics expansions of functions around each atom.
+
+        The function times the aim_weights of each atom is expanded in real
+        spherical harmonics on its atomic grid, with radial splines of the
+        expansion coefficients. The sum of the expansions of all atoms is the
+        function, see interpolate.
+
+        Parameters
+        ----------
+        value_arrays : np.ndarray(K,) or np.ndarray(F, K)
+            Values of one or F functions on the grid points
+        l_max : int, optional
+            Largest angular degree of the expansions, default to half of the
+            largest angular degree of each atomic grid
+
+        Returns
+        -------
+        list[scipy.CubicSpline]
+            Spline of the expansion coefficients, of shape (L,) or (F, L), of
+            each atom. See grid.interpolate.generate_real_sph_harms for the
+            layout of the L spherical harmonics.
+        """
+        value_arrays = np.asarray(value_arrays)
+        if value_arrays.shape[-1] != self.size:
+            raise ValueError(
+                f"Values need to have {self.size} points, got shape {value_arrays.shape}."
+            )
+        splines = []
+        for i, atom_grid in enumerate(self._atomic_grids):
+            s_ind, f_ind = self._indices[i], self._indices[i + 1]
+            # divide by the radial weights of each shell, times 4 pi
+            sizes = np.diff(atom_grid.indices)
+            shell_weights = np.add.reduceat(atom_grid.weights, atom_grid.indices[:-1])
+            radial_weights = np.repeat(shell_weights / (4 * np.pi), sizes)
+            values = value_arrays[..., s_ind:f_ind] * self.aim_weights[s_ind:f_ind]
+            np.divide(values, radial_weights, out=values, where=radial_weights > 0)
+            splines.append(atom_grid.spline_with_sph_harms(values, l_max))
+        return splines
+
+    def interpolate(self, splines, points, *, cutoffs=None, chunk_size=None, deriv=0):
+        """Evaluate spherical harmonics expansions of each atom on given points.
+
+        Each atom only contributes to points within its cutoff distance and
+        within the last radial point of its expansion. Points are evaluated in
+        blocks of at most max_memory bytes of scratch memory. Gradients and
+        Laplacians are evaluated from the same expansions, see
+        grid.interpolate.eval_sph_harm_expansion.
+
+        Parameters
+        ----------
+        splines : list[scipy.CubicSpline]
+            Expansion of each atom, see spline_with_sph_harms
+        points : np.ndarray(P, 3)
+            Cartesian coordinates of points to evaluate
+        cutoffs : float or np.ndarray(N,), optional, keyword-only argument
+            Largest distance of points to each atom for its expansion
+        chunk_size : int, optional, keyword-only argument
+            Number of points evaluated in one block, default to the number of
+            points within max_memory
+        deriv : int, default to 0, keyword-only argument
+            0 for values, 1 for gradients and 2 for Laplacians
+
+        Returns
+        -------
+        np.ndarray(P,) or np.ndarray(P, 3)
+            Interpolated values, gradients or Laplacians of the functions on
+            given points, with an extra axis (F,) first for F functions
+
+        Raises
+        ------
+        ValueError
+            Number of splines does not match the number of atoms, or deriv is
+            not 0, 1 or 2
+        """
+        if len(splines) != len(self._coors):
+            raise ValueError(f"Need {len(self._coors)} splines, got {len(splines)}")
+        if deriv not in [0, 1, 2]:
+            raise ValueError(f"deriv should be 0, 1 or 2, got {deriv}")
+        points = np.asarray(points, dtype=float)
+        r_max = np.array([spline.x[-1] for spline in splines])
+        if cutoffs is not None:
+            r_max = np.minimum(r_max, cutoffs)
+        func_shape = splines[0].c.shape[2:-1]
+        n_funcs = int(np.prod(func_shape))
+        n_sph_harms = max(spline.c.shape[-1] for spline in splines)
+        # plus relative coordinates and neighbour index of each point
+        point_bytes = eval_sph_harm_expansion_bytes(n_sph_harms, n_funcs, deriv)
+        point_bytes += 8 * 4
+        chunk = get_chunk_size(len(points), point_bytes, chunk_size, self._max_memory)
+        result = np.zeros(func_shape + (len(points),) + (3,) * (deriv == 1))
+        for begin in range(0, len(points), chunk):
+            sub_points = points[begin : begin + chunk]
+            tree = cKDTree(sub_points)
+            for spline, center, cutoff in zip(splines, self._coors, r_max):
+                near = np.array(tree.query_ball_point(center, cutoff), dtype=int)
+                if near.size == 0:
+                    continue
+                index = (Ellipsis, begin + near) + (slice(None),) * (deriv == 1)
+                result[index] += eval_sph_harm_expansion(
+                    spline, sub_points[near] - center, deriv
+                )
+        return result
+
     def __getitem__(self, index):
         """Get separate atomic grid in molecules.
 
@@ -109,7 +534,7 @@ class MolGrid(Grid):
         AtomicGrid
             AtomicGrid of desired atom with aim weights integrated
         """
-        if self._atomic_grids is None:
+        if not self._store:
             s_ind = self._indices[index]
             f_ind = self._indices[index + 1]
             return SimpleAtomicGrid(
@@ -118,3 +543,261 @@ class MolGrid(Grid):
                 self._coors[index],
             )
         return self._atomic_grids[index]
+
+
+def _copy_without_moved_points(atom_grid):
+    """Copy an atomic grid, sharing its arrays but not its translated points.
+
+    Parameters
+    ----------
+    atom_grid : AtomicGrid or SimpleAtomicGrid
+        Atomic grid to copy
+
+    Returns
+    -------
+    AtomicGrid or SimpleAtomicGrid
+        Shallow copy of atom_grid, translated points of an AtomicGrid are
+        computed again on first access
+    """
+    atom_grid = copy.copy(atom_grid)
+    if hasattr(atom_grid, "_moved_points"):
+        atom_grid._moved_points = atom_grid._points_center = None
+    return atom_grid
+
+
+def _generate_sector_aim_weights(
+    method, points, pair_table, index, max_memory, splines=None, screen_tol=None
+):
+    """Compute aim_weights of points in the sector of one atom.
+
+    Parameters
+    ----------
+    method : str
+        Method of aim_weights, "becke", "ssf" or "hirshfeld"
+    points : np.ndarray(M, 3)
+        Coordinates of points in the sector
+    pair_table : AtomPairTable
+        Atom pair quantities of the molecule, with radii
+    index : int
+        Index of the atom of the sector
+    max_memory : int or None
+        Upper bound (in bytes) of the scratch memory
+    splines : list[CubicSpline], optional
+        Radial pro-atom density spline of each atom, for "hirshfeld"
+    screen_tol : float, optional
+        Screening tolerance of "becke" aim_weights, no screening if None
+
+    Returns
+    -------
+    np.ndarray(M,)
+        Atom in molecule weights for each point
+    """
+    if method == "becke":
+        return BeckeWeights.generate_becke_weights(
+            points,
+            pair_table.radii,
+            pair_table.coors,
+            select=[index],
+            max_memory=max_memory,
+            screen=screen_tol is not None,
+            screen_tol=screen_tol or 0.0,
+            pair_table=pair_table,
+        )
+    if method == "hirshfeld":
+        return HirshfeldWeights.generate_hirshfeld_weights(
+            points,
+            pair_table.coors,
+            splines,
+            select=[index],
+            max_memory=max_memory,
+        )
+    return SSFWeights.generate_ssf_weights(
+        points,
+        pair_table.coors,
+        select=[index],
+        max_memory=max_memory,
+        pair_table=pair_table,
+    )
+
+
+def _generate_shared_sector_aim_weights(
+    method,
+    points_name,
+    aim_name,
+    size,
+    s_ind,
+    f_ind,
+    pair_table,
+    index,
+    max_memory,
+    splines=None,
+    screen_tol=None,
+):
+    """Compute aim_weights of one sector with points and results in shared memory.
+
+    Only used with Python >= 3.8, see _HAS_SHARED_MEMORY.
+
+    Parameters
+    ----------
+    method : str
+        Method of aim_weights, "becke", "ssf" or "hirshfeld"
+    points_name : str
+        Name of the shared memory block with all points
+    aim_name : str
+        Name of the shared memory block for all aim_weights
+    size : int
+        Total number of points
+    s_ind : int
+        Index of the first point of the sector
+    f_ind : int
+        Index of the last (excluded) point of the sector
+    pair_table : AtomPairTable
+        Atom pair quantities of the molecule, with radii
+    index : int
+        Index of the atom of the sector
+    max_memory : int or None
+        Upper bound (in bytes) of the scratch memory
+    splines : list[CubicSpline], optional
+        Radial pro-atom density spline of each atom, for "hirshfeld"
+    screen_tol : float, optional
+        Screening tolerance of "becke" aim_weights, no screening if None
+    """
+    from multiprocessing.shared_memory import SharedMemory
+
+    points_shm = SharedMemory(name=points_name)
+    aim_shm = SharedMemory(name=aim_name)
+    try:
+        points = np.ndarray((size, 3), buffer=points_shm.buf)
+        aim_weights = np.ndarray((size,), buffer=aim_shm.buf)
+        aim_weights[s_ind:f_ind] = _generate_sector_aim_weights(
+            method,
+            points[s_ind:f_ind],
+            pair_table,
+            index,
+            max_memory,
+            splines,
+            screen_tol,
+        )
+        # release views before closing the shared memory
+        del points, aim_weights
+    finally:
+        points_shm.close()
+        aim_shm.close()
+
+
+def _generate_parallel_aim_weights(
+    method,
+    points,
+    pair_table,
+    indices,
+    max_memory,
+    n_workers,
+    atoms,
+    splines=None,
+    executor=None,
+    screen_tol=None,
+):
+    """Compute aim_weights of all sectors in a process pool.
+
+    Parameters
+    ----------
+    method : str
+        Method of aim_weights, "becke", "ssf" or "hirshfeld"
+    points : np.ndarray(K, 3)
+        Coordinates of all points
+    pair_table : AtomPairTable
+        Atom pair quantities of the molecule, with radii
+    indices : np.ndarray(N + 1,)
+        Indices of the first point of each sector
+    max_memory : int or None
+        Upper bound (in bytes) of the scratch memory for each process
+    n_workers : int
+        Number of processes, if no executor is given
+    atoms : np.ndarray(L,)
+        Indices of atoms whose aim_weights are computed
+    splines : list[CubicSpline], optional
+        Radial pro-atom density spline of each atom, for "hirshfeld"
+    executor : concurrent.futures.Executor, optional
+        Executor for the sectors, default to a new process pool
+    screen_tol : float, optional
+        Screening tolerance of "becke" aim_weights, no screening if None
+
+    Returns
+    -------
+    np.ndarray(K,)
+        Atom in molecule weights for each point, zero for points of atoms
+        not in atoms
+    """
+    if executor is None:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            return _generate_parallel_aim_weights(
+                method,
+                points,
+                pair_table,
+                indices,
+                max_memory,
+                n_workers,
+                atoms,
+                splines,
+                executor,
+                screen_tol,
+            )
+    # largest sectors first for better load balance
+    atoms = np.asarray(atoms, dtype=int)
+    order = atoms[np.argsort(-np.diff(indices)[atoms], kind="stable")]
+    if not _HAS_SHARED_MEMORY:
+        aim_weights = np.zeros(len(points))
+        futures = [
+            executor.submit(
+                _generate_sector_aim_weights,
+                method,
+                points[indices[i] : indices[i + 1]],
+                pair_table,
+                i,
+                max_memory,
+                splines,
+                screen_tol,
+            )
+            for i in order
+        ]
+        for i, future in zip(order, futures):
+            aim_weights[indices[i] : indices[i + 1]] = future.result()
+        return aim_weights
+    from multiprocessing.shared_memory import SharedMemory
+
+    size = len(points)
+    points_shm = SharedMemory(create=True, size=max(points.nbytes, 1))
+    aim_shm = SharedMemory(create=True, size=max(8 * size, 1))
+    try:
+        shared_points = np.ndarray((size, 3), buffer=points_shm.buf)
+        shared_points[:] = points
+        aim_weights = np.ndarray((size,), buffer=aim_shm.buf)
+        aim_weights[:] = 0
+        del aim_weights
+        futures = [
+            executor.submit(
+                _generate_shared_sector_aim_weights,
+                method,
+                points_shm.name,
+                aim_shm.name,
+                size,
+                indices[i],
+                indices[i + 1],
+                pair_table,
+                i,
+                max_memory,
+                splines,
+                screen_tol,
+            )
+            for i in order
+        ]
+        for future in futures:
+            future.result()
+        aim_weights = np.ndarray((size,), buffer=aim_shm.buf).copy()
+        del shared_points
+    finally:
+        points_shm.close()
+        points_shm.unlink()
+        aim_shm.close()
+        aim_shm.unlink()
+    return aim_weights
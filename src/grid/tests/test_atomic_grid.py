@@ -1,9 +1,19 @@
 """Test class for atomic grid."""
 from unittest import TestCase
 
-from grid.atomic_grid import AtomicGrid
+from grid.atomic_grid import (
+    AtomicGrid,
+    atomic_grid_cache_info,
+    clear_atomic_grid_cache,
+    get_pruning_params,
+    resize_atomic_grid_cache,
+)
 from grid.basegrid import Grid
+from grid.interpolate import generate_real_sph_harms, lm_pairs, spline_with_sph_harms
 from grid.lebedev import generate_lebedev_grid
+from grid.onedgrid import HortonLinear
+from grid.rtransform import ExpRTransform
+from grid.utils import get_cov_radii
 
 import numpy as np
 from numpy.testing import assert_allclose, assert_equal
@@ -58,6 +68,47 @@ class TestAtomicGrid(TestCase):
             unit_sphere2[4].points.shape, unit_sphere2[6].points.shape
         )
 
+    def test_atomic_grid_template_cache(self):
+        """Test atomic grids of same element share cached arrays."""
+        rad_grid = Grid(np.linspace(0.1, 2, 10), np.ones(10))
+        scales = np.array([0.5, 1.0])
+        degs = np.array([5, 7, 9])
+        clear_atomic_grid_cache()
+        atgrid1 = AtomicGrid(rad_grid, 1.0, scales=scales, degs=degs)
+        atgrid2 = AtomicGrid(
+            Grid(np.linspace(0.1, 2, 10), np.ones(10)),
+            1.0,
+            scales=scales,
+            degs=degs,
+            center=np.array([1.0, 0.0, -1.0]),
+        )
+        assert atomic_grid_cache_info() == (1, 1, 128, 1)
+        assert atgrid2._points is atgrid1._points
+        assert atgrid2.weights is atgrid1.weights
+        assert atgrid2.indices is atgrid1.indices
+        assert not atgrid1.weights.flags.writeable
+        assert_allclose(atgrid2.points, atgrid1.points + [1.0, 0.0, -1.0])
+        # other radius gives new arrays
+        atgrid3 = AtomicGrid(rad_grid, 1.5, scales=scales, degs=degs)
+        assert atgrid3.weights is not atgrid1.weights
+        assert atomic_grid_cache_info() == (1, 2, 128, 2)
+        # least recently used template is removed
+        resize_atomic_grid_cache(1)
+        assert atomic_grid_cache_info().currsize == 1
+        atgrid4 = AtomicGrid(rad_grid, 1.5, scales=scales, degs=degs)
+        assert atgrid4.weights is atgrid3.weights
+        # no cache
+        resize_atomic_grid_cache(0)
+        atgrid5 = AtomicGrid(rad_grid, 1.5, scales=scales, degs=degs)
+        assert atgrid5.weights is not atgrid3.weights
+        assert_equal(atgrid5.weights, atgrid3.weights)
+        assert atomic_grid_cache_info().currsize == 0
+        with self.assertRaises(ValueError):
+            resize_atomic_grid_cache(-1)
+        resize_atomic_grid_cache(128)
+        clear_atomic_grid_cache()
+        assert atomic_grid_cache_info() == (0, 0, 128, 0)
+
     def test_generate_atomic_grid(self):
         """Test for generating atomic grid."""
         # setup testing class
@@ -65,8 +116,7 @@ class TestAtomicGrid(TestCase):
         rad_wts = np.array([0.3, 0.4, 0.3])
         rad_grid = Grid(rad_pts, rad_wts)
         degs = np.array([3, 5, 7])
-        center = np.array([0, 0, 0])
-        pts, wts, ind = AtomicGrid._generate_atomic_grid(rad_grid, degs, center)
+        pts, wts, ind = AtomicGrid._generate_atomic_grid(rad_grid, degs)
         assert len(pts) == 46
         assert_equal(ind, [0, 6, 20, 46])
         # set tests for slicing grid from atomic grid
@@ -81,24 +131,175 @@ class TestAtomicGrid(TestCase):
                 ref_grid.weights * rad_wts[i] * rad_pts[i] ** 2,
             )
 
-    def test_atomic_grid(center):
-        """Test atomic grid center transilation."""
-        rad_pts = np.array([0.1, 0.5, 1])
-        rad_wts = np.array([0.3, 0.4, 0.3])
-        rad_grid = Grid(rad_pts, rad_wts)
-        degs = np.array([3, 5, 7])
-        # origin center
-        center = np.array([0, 0, 0])
-        # randome center
-        ref_center = np.random.rand(3)
-        pts, wts, ind = AtomicGrid._generate_atomic_grid(rad_grid, degs, center)
-        ref_pts, ref_wts, ref_ind = AtomicGrid._generate_atomic_grid(
-            rad_grid, degs, ref_center
+    def test_generate_atomic_grid_shells(self):
+        """Test shells grouped by degree match shells generated one by one."""
+        rad_grid = Grid(np.random.uniform(0.01, 5, 7), np.random.uniform(0, 1, 7))
+        degs = np.array([3, 7, 3, 5, 7, 7, 11])
+        pts, wts, ind = AtomicGrid._generate_atomic_grid(rad_grid, degs)
+        ref_pts, ref_wts, ref_ind = [], [], [0]
+        for i, deg in enumerate(degs):
+            sphere_grid = generate_lebedev_grid(degree=deg)
+            ref_pts.append(sphere_grid.points * rad_grid[i].points)
+            ref_wts.append(
+                sphere_grid.weights * rad_grid[i].weights * rad_grid[i].points ** 2
+            )
+            ref_ind.append(ref_ind[-1] + sphere_grid.size)
+        assert_equal(ind, ref_ind)
+        assert_allclose(pts, np.vstack(ref_pts), rtol=1e-15, atol=0)
+        assert_allclose(wts, np.hstack(ref_wts), rtol=1e-15, atol=0)
+
+    def test_atomic_grid_center_setter(self):
+        """Test moving atomic grid to a new center."""
+        rad_grid = Grid(np.array([0.1, 0.5, 1]), np.array([0.3, 0.4, 0.3]))
+        atgrid = AtomicGrid(rad_grid, 1.0, scales=[], degs=[5])
+        points = atgrid.points
+        atgrid.center = np.array([1.0, 2.0, 3.0])
+        assert_allclose(atgrid.points, points + [1.0, 2.0, 3.0])
+        with self.assertRaises(TypeError):
+            atgrid.center = (0, 0, 0)
+        with self.assertRaises(ValueError):
+            atgrid.center = np.zeros(4)
+
+    def test_atomic_grid_points_cache(self):
+        """Test translated points are cached and written into given arrays."""
+        rad_grid = Grid(np.array([0.1, 0.5, 1]), np.array([0.3, 0.4, 0.3]))
+        center = np.array([1.0, 0.0, 0.0])
+        atgrid = AtomicGrid(rad_grid, 1.0, scales=[], degs=[5], center=center)
+        points = atgrid.points
+        assert atgrid.points is points
+        assert not points.flags.writeable
+        assert_allclose(points, atgrid._points + center)
+        # in-place change of center is also noticed
+        center[1] = 2.0
+        assert_allclose(atgrid.points, atgrid._points + [1.0, 2.0, 0.0])
+        atgrid.center = np.array([0.0, 0.0, -1.0])
+        assert_allclose(atgrid.points, atgrid._points + [0.0, 0.0, -1.0])
+        # write into slice of larger array
+        buffer = np.zeros((atgrid.size + 2, 3))
+        result = atgrid.get_points(out=buffer[1:-1])
+        assert np.shares_memory(result, buffer)
+        assert_equal(buffer[1:-1], atgrid.points)
+        assert_equal(buffer[[0, -1]], 0)
+        assert atgrid.get_points() is atgrid.points
+
+    def test_pruning_presets(self):
+        """Test pruned atomic grids from presets."""
+        atomic_rad, scales, degs = get_pruning_params(6)
+        assert_allclose(atomic_rad, get_cov_radii(6))
+        assert_allclose(scales, [0.1667, 0.5, 0.9, 3.5])
+        assert_equal(degs, [3, 9, 15, 23, 15])
+        assert_allclose(get_pruning_params(1)[1], [0.25, 0.5, 1.0, 4.5])
+        assert_allclose(get_pruning_params(2)[1], [0.25, 0.5, 1.0, 4.5])
+        assert_allclose(get_pruning_params(3)[1], [0.1667, 0.5, 0.9, 3.5])
+        assert_allclose(get_pruning_params(11)[1], [0.1, 0.4, 0.8, 2.5])
+        assert_allclose(get_pruning_params(18)[1], [0.1, 0.4, 0.8, 2.5])
+        # noble gases without bragg radius use cambridge radius
+        assert_allclose(get_pruning_params(10)[0], get_cov_radii(10, "cambridge"))
+        assert_allclose(
+            get_pruning_params(6, rad_type="cambridge")[0],
+            get_cov_radii(6, "cambridge"),
+        )
+        # pruned grid is accurate with far fewer points than unpruned grid
+        rad_grid = ExpRTransform(1e-4, 20).transform_grid(HortonLinear(50))
+        center = np.array([0.3, 0.1, -0.2])
+        atgrid = AtomicGrid.from_preset(rad_grid, 8, "sg1-d35", center=center)
+        atomic_rad, _, degs = get_pruning_params(8, "sg1-d35")
+        full = AtomicGrid(rad_grid, atomic_rad, scales=[], degs=[max(degs)])
+        assert atgrid.size < 0.6 * full.size
+        assert_allclose(atgrid.center, center)
+        for grid in [atgrid, full]:
+            value = grid.integrate(np.exp(-np.sum(grid.points ** 2, axis=1)))
+            assert_allclose(value, np.pi ** 1.5, atol=1e-5)
+        with self.assertRaises(ValueError):
+            get_pruning_params(6, "unknown")
+        # invented ladder does not reuse the names of the old_grid presets
+        for name in ["coarse", "medium", "fine", "veryfine", "ultrafine", "insane"]:
+            with self.assertRaises(ValueError):
+                get_pruning_params(6, name)
+        # SG-1 regions are only defined for H to Ar
+        for atnum in [0, 19, 26]:
+            with self.assertRaises(ValueError):
+                get_pruning_params(atnum, "sg1-d35")
+        with self.assertRaises(ValueError):
+            AtomicGrid.from_preset(rad_grid, 6, "sg1", rad_type="unknown")
+
+    def test_spherical_average(self):
+        """Test spherical averages and shell integrals of functions."""
+        rad_grid = ExpRTransform(1e-3, 5).transform_grid(HortonLinear(30))
+        center = np.array([0.5, -0.2, 0.1])
+        atgrid = AtomicGrid(rad_grid, 1.0, scales=[], degs=[29], center=center)
+        # gaussian centered at distance d from atomic grid center
+        shift = np.array([0.3, 0.0, 0.4])
+        diff = atgrid.points - center - shift
+        values = np.exp(-np.sum(diff ** 2, axis=1))
+        grads = -2 * diff * values[:, None]
+        shells = atgrid.integrate_shells(np.array([values, 2 * values]))
+        assert shells.shape == (2, 30)
+        assert_allclose(
+            np.sum(shells, axis=1), np.array([1, 2]) * atgrid.integrate(values)
+        )
+        # analytic spherical average and its radial derivative
+        r, d = rad_grid.points, 0.5
+        ref = np.exp(-(r ** 2) - d ** 2) * np.sinh(2 * r * d) / (2 * r * d)
+        ref_deriv = -2 * r * ref + np.exp(-(r ** 2) - d ** 2) * (
+            np.cosh(2 * r * d) / r - np.sinh(2 * r * d) / (2 * r ** 2 * d)
+        )
+        average, deriv = atgrid.get_spherical_average(values, grads=grads)
+        assert_allclose(average, ref, atol=1e-10)
+        assert_allclose(deriv, ref_deriv, atol=1e-10)
+        averages = atgrid.get_spherical_average(np.array([values, values ** 2]))
+        assert averages.shape == (2, 30)
+        assert_allclose(averages[0], ref, atol=1e-10)
+        with self.assertRaises(ValueError):
+            atgrid.integrate_shells(values[:-1])
+        with self.assertRaises(ValueError):
+            atgrid.get_spherical_average(values, grads=grads[:, :2])
+
+    def test_convert_cart_to_sph(self):
+        """Test spherical coordinates from cached unit sphere angles."""
+        rad_grid = Grid(np.array([0.1, 0.5, 1.0, 2.0]), np.ones(4))
+        center = np.array([1.0, -1.0, 0.5])
+        atgrid = AtomicGrid(
+            rad_grid, 1.0, scales=[0.3, 1.5], degs=[5, 11, 7], center=center
+        )
+        sph_coors = atgrid.convert_cart_to_sph()
+        points = atgrid.points - center
+        r = np.linalg.norm(points, axis=1)
+        assert_allclose(sph_coors[:, 2], r)
+        assert_allclose(sph_coors[:, 1], np.arccos(points[:, 2] / r))
+        assert_allclose(sph_coors[:, 0], np.arctan2(points[:, 1], points[:, 0]))
+        # angles are cached for each degree
+        angles = AtomicGrid._get_sphere_angles(11)
+        assert AtomicGrid._get_sphere_angles(11) is angles
+        assert not angles.flags.writeable
+        assert_allclose(sph_coors[atgrid.indices[1] : atgrid.indices[2], :2], angles)
+
+    def test_spline_with_sph_harms(self):
+        """Test spherical harmonics expansion with cached projector."""
+        rad_grid = Grid(np.linspace(0.5, 3, 8), np.full(8, 0.3))
+        atgrid = AtomicGrid(rad_grid, 1.0, scales=[1.0, 2.0], degs=[7, 11, 9])
+        sph_coors = atgrid.convert_cart_to_sph()
+        sph_harm = generate_real_sph_harms(3, sph_coors[:, 0], sph_coors[:, 1])
+        projector = atgrid.get_sph_harm_projector(3)
+        assert_allclose(projector, sph_harm * atgrid.weights, atol=1e-14)
+        assert atgrid.get_sph_harm_projector(3) is not projector
+        projector = atgrid.get_sph_harm_projector(3, cache=True)
+        assert atgrid.get_sph_harm_projector(3) is projector
+        assert not projector.flags.writeable
+        # same expansion as interpolate module up to resolved l of each shell
+        points = atgrid.points
+        values = np.array([points[:, 0] * points[:, 2], np.sum(points ** 2, axis=1)])
+        spline = atgrid.spline_with_sph_harms(values, 3, cache=True)
+        ref = spline_with_sph_harms(
+            sph_harm, values, atgrid.weights, atgrid.indices, rad_grid.points
+        )
+        assert spline.c.shape == ref.c.shape
+        resolved = lm_pairs(3)[0] <= atgrid._rad_degs[:, None] // 2
+        assert_allclose(
+            spline(rad_grid.points), ref(rad_grid.points) * resolved[:, None]
         )
-        # diff grid points diff by center and same weights
-        assert_allclose(pts, ref_pts)
-        assert_allclose(wts, ref_wts)
-        # assert_allclose(target_grid.center + ref_center, ref_grid.center)
+        # default l_max from largest degree
+        assert atgrid.spline_with_sph_harms(values[0]).c.shape[-1] == 36
 
     def test_error_raises(self):
         """Tests for error raises."""
@@ -120,7 +321,7 @@ class TestAtomicGrid(TestCase):
             )
         with self.assertRaises(ValueError):
             AtomicGrid._generate_atomic_grid(
-                Grid(np.arange(3), np.arange(3)), np.arange(2), np.array([0, 0, 0])
+                Grid(np.arange(3), np.arange(3)), np.arange(2)
             )
         with self.assertRaises(TypeError):
             AtomicGrid(
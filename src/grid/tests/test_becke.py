@@ -19,12 +19,13 @@
 #
 # --
 """Becke tests files."""
+
 from unittest import TestCase
 
-from grid.becke import BeckeWeights
+from grid.becke import AtomPairTable, BeckeWeights, CellWeights, SSFWeights
 
 import numpy as np
-from numpy.testing import assert_allclose
+from numpy.testing import assert_allclose, assert_array_equal
 
 
 class TestBecke(TestCase):
@@ -132,3 +133,235 @@ class TestBecke(TestCase):
             BeckeWeights.generate_becke_weights(
                 points, radii, centers[0], select=[0, 1], pt_ind=[0, 10, 50, 99]
             )
+
+    def test_becke_chunks(self):
+        """Test becke weights are independent of block size."""
+        npoint = 300
+        points = np.random.uniform(-5, 5, (npoint, 3))
+        radii = np.array([0.5, 0.8, 5.0, 1.2])
+        centers = np.random.uniform(-3, 3, (4, 3))
+        pt_ind = [0, 50, 120, 121, 300]
+        ref = BeckeWeights.generate_becke_weights(points, radii, centers, pt_ind=pt_ind)
+        for chunk_size in [1, 7, 64, 299, 1000]:
+            weights = BeckeWeights.generate_becke_weights(
+                points, radii, centers, pt_ind=pt_ind, chunk_size=chunk_size
+            )
+            assert_array_equal(weights, ref)
+        for max_memory in [1, 1000, 10 ** 5]:
+            weights = BeckeWeights.generate_becke_weights(
+                points, radii, centers, pt_ind=pt_ind, max_memory=max_memory
+            )
+            assert_array_equal(weights, ref)
+        assert BeckeWeights._get_chunk_size(4, 300) == 300
+        assert BeckeWeights._get_chunk_size(4, 300, chunk_size=5) == 5
+        assert BeckeWeights._get_chunk_size(4, 300, max_memory=8 * 64 * 10) == 10
+        with self.assertRaises(ValueError):
+            BeckeWeights._get_chunk_size(4, 300, chunk_size=0)
+        with self.assertRaises(ValueError):
+            BeckeWeights._get_chunk_size(4, 300, max_memory=-1)
+
+    def test_cell_products(self):
+        """Test cell function products with the direct formula."""
+        points = np.random.uniform(-5, 5, (50, 3))
+        radii = np.random.uniform(0.5, 2.0, 5)
+        centers = np.random.uniform(-3, 3, (5, 3))
+        dist = BeckeWeights._atomic_dists(centers)
+        alpha = BeckeWeights._calculate_alpha(radii)
+        ref = np.ones((5, 50))
+        for i in range(5):
+            for j in range(5):
+                if i == j:
+                    continue
+                n_i = np.linalg.norm(points - centers[i], axis=-1)
+                n_j = np.linalg.norm(points - centers[j], axis=-1)
+                mu = (n_i - n_j) / dist[i, j]
+                v_pp = mu + alpha[i, j] * (1 - mu ** 2)
+                ref[i] *= 0.5 * (1 - BeckeWeights._switch_func(v_pp))
+        buffers = tuple(np.empty(size) for size in [750, 250, 500, 500, 1250])
+        pair_table = AtomPairTable(centers, radii)
+        cell_prod = BeckeWeights._compute_cell_products(points, pair_table, 3, buffers)
+        assert_allclose(cell_prod, ref, atol=1e-14)
+
+    def test_atom_pair_table(self):
+        """Test atom pair table and reuse of it for weights."""
+        centers = np.array([[0.0, 0.0, 0.0], [1.0, 0.0, 0.0], [0.0, 3.0, 0.0]])
+        radii = np.array([0.5, 1.0, 1.5])
+        pair_table = AtomPairTable(centers, radii)
+        assert pair_table.size == 3
+        assert_allclose(pair_table.dists, BeckeWeights._atomic_dists(centers))
+        assert_allclose(pair_table.alpha, BeckeWeights._calculate_alpha(radii))
+        ref_inv = np.zeros((3, 3))
+        ref_inv[[0, 0, 1], [1, 2, 2]] = [1, 1 / 3, 1 / np.sqrt(10)]
+        assert_allclose(pair_table.inv_dists, ref_inv + ref_inv.T)
+        assert_allclose(pair_table.nearest_dists, [1, 1, 3])
+        assert_array_equal(pair_table.pairs[0], [0, 0, 1])
+        assert_array_equal(pair_table.pairs[1], [1, 2, 2])
+        neighbours = pair_table.neighbours(2.0)
+        assert_array_equal(neighbours[0], [1])
+        assert_array_equal(neighbours[1], [0])
+        assert_array_equal(neighbours[2], [])
+        assert_allclose(AtomPairTable(centers[:1]).nearest_dists, [np.inf])
+        # weights are the same with given pair table
+        points = np.random.uniform(-3, 3, (40, 3))
+        ref = BeckeWeights.generate_becke_weights(points, radii, centers, select=[1])
+        weights = BeckeWeights.generate_becke_weights(
+            points, radii, centers, select=[1], pair_table=pair_table
+        )
+        assert_array_equal(weights, ref)
+        ref = SSFWeights.generate_ssf_weights(points, centers, select=[1])
+        weights = SSFWeights.generate_ssf_weights(
+            points, centers, select=[1], pair_table=pair_table
+        )
+        assert_array_equal(weights, ref)
+        with self.assertRaises(ValueError):
+            AtomPairTable(centers[0])
+        with self.assertRaises(ValueError):
+            AtomPairTable(centers, radii[:2])
+
+    def test_becke_screen(self):
+        """Test screened becke weights."""
+        centers = np.random.uniform(-6, 6, (12, 3))
+        radii = np.random.uniform(0.5, 2.0, 12)
+        # points distributed around each center
+        rad = np.exp(np.random.uniform(np.log(1e-3), np.log(10), (12, 50)))
+        direct = np.random.normal(size=(12, 50, 3))
+        direct /= np.linalg.norm(direct, axis=-1)[..., None]
+        points = (centers[:, None] + rad[..., None] * direct).reshape(-1, 3)
+        pt_ind = np.arange(13) * 50
+        ref = BeckeWeights.generate_becke_weights(points, radii, centers, pt_ind=pt_ind)
+        weights = BeckeWeights.generate_becke_weights(
+            points, radii, centers, pt_ind=pt_ind, screen=True, screen_tol=0
+        )
+        assert_array_equal(weights, ref)
+        screened = BeckeWeights.generate_becke_weights(
+            points, radii, centers, pt_ind=pt_ind, screen=True
+        )
+        assert_allclose(screened, ref, atol=1e-8)
+        weights = BeckeWeights.generate_becke_weights(
+            points, radii, centers, pt_ind=pt_ind, screen=True, chunk_size=33
+        )
+        assert_array_equal(weights, screened)
+        # special points
+        weights = BeckeWeights.generate_becke_weights(
+            centers, radii, centers, pt_ind=np.arange(13), screen=True
+        )
+        assert_allclose(weights, np.ones(12))
+
+    def test_becke_screen_chain(self):
+        """Test screened becke weights of a chain only use nearby atoms."""
+        n_atoms = 40
+        centers = np.zeros((n_atoms, 3))
+        centers[:, 0] = 2.9 * np.arange(n_atoms)
+        centers[1::2, 1] = 1.0
+        radii = np.where(np.arange(n_atoms) % 3 == 0, 0.3, 0.75)
+        rad = np.exp(np.random.uniform(np.log(1e-3), np.log(5), (n_atoms, 30)))
+        direct = np.random.normal(size=(n_atoms, 30, 3))
+        direct /= np.linalg.norm(direct, axis=-1)[..., None]
+        points = (centers[:, None] + rad[..., None] * direct).reshape(-1, 3)
+        pt_ind = np.arange(n_atoms + 1) * 30
+        ref = BeckeWeights.generate_becke_weights(points, radii, centers, pt_ind=pt_ind)
+        weights = BeckeWeights.generate_becke_weights(
+            points, radii, centers, pt_ind=pt_ind, screen=True
+        )
+        assert_allclose(weights, ref, atol=1e-7)
+        # most points have few neighbours
+        pair_table = AtomPairTable(centers, radii)
+        near_dists, nearest = pair_table.tree.query(points)
+        ratios = BeckeWeights._screen_ratios(pair_table, 3, 1e-10)
+        assert np.all(ratios > 1)
+        pt_ind, _ = BeckeWeights._screen_neighbours(
+            points, pair_table, near_dists * ratios[nearest], nearest
+        )
+        counts = np.bincount(pt_ind, minlength=len(points))
+        assert np.all(counts >= 1)
+        assert np.median(counts) < n_atoms / 2
+
+    def test_becke_weights_deriv(self):
+        """Test becke weights derivatives with finite difference."""
+        points = np.random.uniform(-3, 3, (30, 3))
+        radii = np.array([0.5, 0.8, 1.5, 1.2])
+        centers = np.random.uniform(-2, 2, (4, 3))
+        points[0] = centers[1]
+        pt_ind = [0, 5, 12, 20, 30]
+        select = np.repeat(np.arange(4), np.diff(pt_ind))
+        ref = BeckeWeights.generate_becke_weights(points, radii, centers, pt_ind=pt_ind)
+        for moving in [False, True]:
+            weights, deriv = BeckeWeights.generate_becke_weights_deriv(
+                points,
+                radii,
+                centers,
+                pt_ind=pt_ind,
+                moving_points=moving,
+                chunk_size=7,
+            )
+            assert_allclose(weights, ref)
+            step = 1e-6
+            for i in range(4):
+                for j in range(3):
+                    shift = np.zeros((4, 3))
+                    shift[i, j] = step
+                    pt_shift = shift[select] if moving else 0
+                    w_p = BeckeWeights.generate_becke_weights(
+                        points + pt_shift, radii, centers + shift, pt_ind=pt_ind
+                    )
+                    w_m = BeckeWeights.generate_becke_weights(
+                        points - pt_shift, radii, centers - shift, pt_ind=pt_ind
+                    )
+                    assert_allclose(deriv[:, i, j], (w_p - w_m) / step / 2, atol=1e-8)
+
+
+class TestSSF(TestCase):
+    """Stratmann-Scuseria-Frisch weight class tests."""
+
+    def test_switch_func(self):
+        """Test piecewise switching function."""
+        x = np.linspace(-1, 1, 201)
+        g = SSFWeights._switch_func(x)
+        assert_allclose(g[x <= -0.64], -1)
+        assert_allclose(g[x >= 0.64], 1)
+        assert_allclose(g, -g[::-1])
+        assert np.all(np.diff(g) >= 0)
+        # smooth at the edges
+        assert_allclose(SSFWeights._switch_func(0.64 - 1e-5), 1, atol=1e-12)
+
+    def test_ssf_sum_one(self):
+        """Test ssf weights add up to one."""
+        points = np.random.uniform(-5, 5, (100, 3))
+        centers = np.array([[1.2, 2.3, 0.1], [-0.4, 0.0, -2.2], [2.2, -1.5, 0.0]])
+        weights = [
+            SSFWeights.generate_ssf_weights(points, centers, select=[i])
+            for i in range(3)
+        ]
+        assert_allclose(np.sum(weights, axis=0), np.ones(100))
+        weights = SSFWeights.generate_ssf_weights(centers, centers, pt_ind=[0, 1, 2, 3])
+        assert_allclose(weights, [1, 1, 1])
+
+    def test_ssf_screen(self):
+        """Test screened points have the same weights as computed ones."""
+        centers = np.random.uniform(-3, 3, (5, 3))
+        rad = np.exp(np.random.uniform(np.log(1e-3), np.log(5), (5, 40)))
+        direct = np.random.normal(size=(5, 40, 3))
+        direct /= np.linalg.norm(direct, axis=-1)[..., None]
+        points = (centers[:, None] + rad[..., None] * direct).reshape(-1, 3)
+        pt_ind = np.arange(6) * 40
+        weights = SSFWeights.generate_ssf_weights(
+            points, centers, pt_ind=pt_ind, chunk_size=17
+        )
+        s_ab = SSFWeights._compute_cell_products(points, AtomPairTable(centers), 0.64)
+        select = np.repeat(np.arange(5), 40)
+        ref = s_ab[select, np.arange(200)] / np.sum(s_ab, axis=0)
+        assert_allclose(weights, ref)
+        # ssf weights only share the cell function helpers with becke weights
+        assert issubclass(SSFWeights, CellWeights)
+        assert not issubclass(SSFWeights, BeckeWeights)
+
+    def test_raise_errors(self):
+        """Test errors raise."""
+        points = np.random.uniform(-5, 5, (10, 3))
+        centers = np.array([[1.2, 2.3, 0.1], [-0.4, 0.0, -2.2]])
+        with self.assertRaises(ValueError):
+            SSFWeights.generate_ssf_weights(points, centers, a=0)
+        with self.assertRaises(ValueError):
+            SSFWeights.generate_ssf_weights(points, centers, pt_ind=[3])
+        with self.assertRaises(ValueError):
+            SSFWeights.generate_ssf_weights(points, centers[0])
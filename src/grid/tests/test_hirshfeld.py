@@ -0,0 +1,168 @@
+"""Hirshfeld weights test file."""
+
+from unittest import TestCase
+
+from grid.hirshfeld import HirshfeldWeights
+
+import numpy as np
+from numpy.testing import assert_allclose
+
+
+class TestHirshfeld(TestCase):
+    """Test class for Hirshfeld weights."""
+
+    def setUp(self):
+        """Set up radial pro-atom densities."""
+        self.r = np.linspace(0, 10, 201)
+        self.rho = np.exp(-2 * self.r) / np.pi
+
+    def test_spline_proatoms(self):
+        """Test pro-atom splines and their evaluation."""
+        proatom = (self.r, self.rho)
+        other = (self.r, 2 * self.rho)
+        splines = HirshfeldWeights.spline_proatoms([proatom, other, proatom])
+        assert splines[0] is splines[2]
+        assert splines[0] is not splines[1]
+        dists = np.array([0.0, 0.5, 0.53, 9.9, 10.5])
+        rho = HirshfeldWeights._eval_spline(splines[1], dists)
+        ref = 2 * np.exp(-2 * dists) / np.pi
+        ref[-1] = 0
+        assert_allclose(rho, ref, atol=1e-7)
+        # densities of several pro-atoms
+        rhos = np.array([self.rho, 3 * self.rho])
+        spline = HirshfeldWeights.spline_proatoms([(self.r, rhos)])[0]
+        rho = HirshfeldWeights._eval_spline(spline, dists)
+        assert rho.shape == (2, 5)
+        assert_allclose(rho[1], 3 * rho[0])
+        with self.assertRaises(ValueError):
+            HirshfeldWeights.spline_proatoms([(self.r, self.rho[:-1])])
+
+    def test_hirshfeld_weights(self):
+        """Test Hirshfeld weights with reference."""
+        centers = np.array([[0.0, 0.0, 0.0], [1.0, 0.5, 0.0], [-0.5, 1.0, 1.0]])
+        proatoms = [(self.r, self.rho), (self.r, 2 * self.rho)]
+        splines = HirshfeldWeights.spline_proatoms(
+            [proatoms[0], proatoms[1], proatoms[0]]
+        )
+        points = np.random.uniform(-3, 3, (60, 3))
+        dists = np.linalg.norm(points - centers[:, None], axis=-1)
+        rho = np.exp(-2 * dists) / np.pi * np.array([1, 2, 1])[:, None]
+        ref = rho / np.sum(rho, axis=0)
+        total = 0
+        for i in range(3):
+            weights = HirshfeldWeights.generate_hirshfeld_weights(
+                points, centers, splines, select=[i], chunk_size=7
+            )
+            assert_allclose(weights, ref[i], rtol=1e-5)
+            total += weights
+        assert_allclose(total, 1)
+        # points beyond all pro-atoms are shared equally
+        far = np.array([[20.0, 0.0, 0.0]])
+        weights = HirshfeldWeights.generate_hirshfeld_weights(
+            far, centers, splines, select=[1]
+        )
+        assert_allclose(weights, [1 / 3])
+        with self.assertRaises(ValueError):
+            HirshfeldWeights.generate_hirshfeld_weights(points, centers, splines[:2])
+
+    def test_interpolate_proatoms(self):
+        """Test interpolation of pro-atoms for populations."""
+        inf = np.inf
+        pro_pops = np.array([[0.0, 1.0, 2.0], [1.0, 3.0, inf], [1.0, inf, inf]])
+        lower, frac = HirshfeldWeights._interpolate_proatoms(
+            np.array([1.25, 4.0, 1.5]), pro_pops
+        )
+        assert_allclose(lower, [1, 0, 0])
+        assert_allclose(frac, [0.25, 1.5, 0])
+        lower, frac = HirshfeldWeights._interpolate_proatoms(
+            np.array([-0.5, 1.0, 1.0]), pro_pops
+        )
+        assert_allclose(lower, [0, 0, 0])
+        assert_allclose(frac, [-0.5, 0, 0])
+
+    def test_iterative_hirshfeld_weights(self):
+        """Test iterative Hirshfeld recovers populations of pro-atom density."""
+        centers = np.array([[0.0, 0.0, -0.7], [0.0, 0.0, 0.7]])
+        # pro-atoms with populations 0, 1 and 2 of different shapes
+        rhos = np.array(
+            [
+                np.zeros_like(self.r),
+                np.exp(-2 * self.r) / np.pi,
+                2 * 1.5 ** 3 * np.exp(-3 * self.r) / np.pi,
+            ]
+        )
+        proatom = (self.r, rhos)
+        splines = HirshfeldWeights.spline_proatoms([proatom, proatom])
+        # random points and weights, density is the interpolated pro-molecule
+        points = np.random.uniform(-4, 4, (500, 3))
+        weights = np.random.uniform(0.1, 1, 500)
+        dists = np.linalg.norm(points - centers[:, None], axis=-1)
+        rho_0 = HirshfeldWeights._eval_spline(splines[0], dists)
+        # populations of pro-atoms integrated on the same points
+        pro_pops = list(np.einsum("p,kap->ak", weights, rho_0))
+        rho_a = 0.7 * rho_0[1, 0] + 0.3 * rho_0[2, 0]
+        rho_b = 0.6 * rho_0[0, 1] + 0.4 * rho_0[1, 1]
+        density = rho_a + rho_b
+        # fixed point of populations is the integral of each pro-atom
+        ref_pops = np.array([np.sum(weights * rho_a), np.sum(weights * rho_b)])
+        aim_weights, info = HirshfeldWeights.generate_iterative_hirshfeld_weights(
+            points,
+            weights,
+            density,
+            centers,
+            splines,
+            pro_pops,
+            pt_ind=[0, 250, 500],
+            init_populations=[1.3, 0.4],
+            tol=1e-12,
+        )
+        assert info["converged"]
+        assert info["n_iter"] > 1
+        assert info["time"] >= 0
+        assert info["change"] < 1e-12
+        assert_allclose(info["populations"], ref_pops, rtol=1e-8)
+        ref = np.concatenate([(rho_a / density)[:250], (rho_b / density)[250:]])
+        assert_allclose(aim_weights, ref, rtol=1e-6)
+        # weights belong to the returned populations, also in blocks
+        for kwargs in [{"chunk_size": 70}, {"max_memory": 20000}]:
+            sub_weights, info = HirshfeldWeights.generate_iterative_hirshfeld_weights(
+                points,
+                weights,
+                density,
+                centers,
+                splines,
+                pro_pops,
+                pt_ind=[0, 250, 500],
+                init_populations=[1.3, 0.4],
+                max_iter=3,
+                **kwargs,
+            )
+            # pro-atoms interpolated for the returned populations
+            pops, rho = info["populations"], []
+            for i in range(2):
+                k = np.clip(np.searchsorted(pro_pops[i], pops[i]) - 1, 0, 1)
+                f = (pops[i] - pro_pops[i][k]) / (pro_pops[i][k + 1] - pro_pops[i][k])
+                rho.append(np.maximum((1 - f) * rho_0[k, i] + f * rho_0[k + 1, i], 0))
+            ref = np.concatenate([rho[0][:250], rho[1][250:]]) / (rho[0] + rho[1])
+            assert_allclose(sub_weights, ref, rtol=1e-10)
+        # not converged in one iteration
+        _, info = HirshfeldWeights.generate_iterative_hirshfeld_weights(
+            points, weights, density, centers, splines, pro_pops, select=[0], max_iter=1
+        )
+        assert not info["converged"]
+        assert info["n_iter"] == 1
+        with self.assertRaises(ValueError):
+            HirshfeldWeights.generate_iterative_hirshfeld_weights(
+                points,
+                weights,
+                density,
+                centers,
+                splines,
+                pro_pops,
+                select=[0],
+                max_iter=0,
+            )
+        with self.assertRaises(ValueError):
+            HirshfeldWeights.generate_iterative_hirshfeld_weights(
+                points, weights, density, centers, splines, pro_pops[:1], select=[0]
+            )
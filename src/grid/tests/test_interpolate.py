@@ -1,12 +1,20 @@
 """Interpolation tests file."""
+import tracemalloc
 from unittest import TestCase
 
 from grid.atomic_grid import AtomicGrid
 from grid.interpolate import (
+    _convert_ylm_to_zlm,
     _generate_sph_paras,
+    eval_sph_harm_expansion,
+    eval_sph_harm_expansion_bytes,
     generate_real_sph_harms,
+    generate_real_sph_harms_deriv,
     generate_sph_harms,
     interpelate,
+    lm_index,
+    lm_pairs,
+    project_sph_harms,
     spline_with_sph_harms,
 )
 from grid.lebedev import generate_lebedev_grid
@@ -15,6 +23,8 @@ from grid.onedgrid import HortonLinear
 import numpy as np
 from numpy.testing import assert_allclose, assert_almost_equal, assert_array_equal
 
+from scipy.interpolate import CubicSpline
+
 
 class TestInterpolate(TestCase):
     """Interpolation test class."""
@@ -69,12 +79,12 @@ class TestInterpolate(TestCase):
         theta = np.arctan2(pts[:, 1], pts[:, 0])
         # generate spherical harmonics
         sph_h = generate_real_sph_harms(3, theta, phi)  # l_max = 3
-        assert sph_h.shape == (7, 4, 26)
+        assert sph_h.shape == (16, 26)
         for _ in range(20):
             n = np.random.randint(0, 4, 2)
             m1 = np.random.randint(-n[0], n[0] + 1)
             m2 = np.random.randint(-n[1], n[1] + 1)
-            re = sum(sph_h[m1, n[0]] * sph_h[m2, n[1]] * wts)
+            re = sum(sph_h[lm_index(n[0], m1)] * sph_h[lm_index(n[1], m2)] * wts)
             if n[0] != n[1] or m1 != m2:
                 print(n, m1, m2, re)
                 assert_almost_equal(re, 0)
@@ -84,6 +94,140 @@ class TestInterpolate(TestCase):
             # no nan in the final result
             assert np.sum(np.isnan(re)) == 0
 
+    def test_lm_index(self):
+        """Test compact layout of spherical harmonics."""
+        l_list, m_list = lm_pairs(3)
+        assert_array_equal(l_list, [0, 1, 1, 1, 2, 2, 2, 2, 2, 3, 3, 3, 3, 3, 3, 3])
+        assert_array_equal(
+            m_list, [0, -1, 0, 1, -2, -1, 0, 1, 2, -3, -2, -1, 0, 1, 2, 3]
+        )
+        assert_array_equal(lm_index(l_list, m_list), np.arange(16))
+        assert lm_index(2, -1) == 5
+
+    def test_real_sph_harms_recursion(self):
+        """Test recursion of real spherical harmonics with complex harmonics."""
+        theta = np.random.uniform(-np.pi, np.pi, 100)
+        phi = np.random.uniform(0, np.pi, 100)
+        for l_max in [0, 1, 2, 7]:
+            sph_h = generate_real_sph_harms(l_max, theta, phi)
+            assert sph_h.shape == ((l_max + 1) ** 2, 100)
+            ref = _convert_ylm_to_zlm(generate_sph_harms(l_max, theta, phi))
+            l_list, m_list = lm_pairs(l_max)
+            assert_allclose(sph_h, ref[m_list, l_list], atol=1e-10)
+        # analytic p functions
+        ref = np.sqrt(3 / (4 * np.pi)) * np.array(
+            [
+                -np.sin(phi) * np.sin(theta),
+                np.cos(phi),
+                -np.sin(phi) * np.cos(theta),
+            ]
+        )
+        assert_allclose(sph_h[1:4], ref, atol=1e-15)
+        # analytic d functions
+        ref = np.array(
+            [
+                -np.sqrt(15 / (16 * np.pi)) * np.sin(phi) ** 2 * np.sin(2 * theta),
+                -np.sqrt(15 / (4 * np.pi)) * np.sin(phi) * np.cos(phi) * np.sin(theta),
+                np.sqrt(5 / (16 * np.pi)) * (3 * np.cos(phi) ** 2 - 1),
+                -np.sqrt(15 / (4 * np.pi)) * np.sin(phi) * np.cos(phi) * np.cos(theta),
+                np.sqrt(15 / (16 * np.pi)) * np.sin(phi) ** 2 * np.cos(2 * theta),
+            ]
+        )
+        assert_allclose(sph_h[4:9], ref, atol=1e-14)
+        # orthonormal on lebedev grid up to high degree
+        grid = generate_lebedev_grid(degree=101)
+        r = np.linalg.norm(grid.points, axis=1)
+        phi = np.arccos(grid.points[:, 2] / r)
+        theta = np.arctan2(grid.points[:, 1], grid.points[:, 0])
+        sph_h = generate_real_sph_harms(50, theta, phi)
+        assert_allclose((sph_h * grid.weights) @ sph_h.T, np.eye(51 ** 2), atol=1e-10)
+
+    def test_real_sph_harms_deriv(self):
+        """Test derivatives of real spherical harmonics with finite differences."""
+        theta = np.random.uniform(-np.pi, np.pi, 100)
+        phi = np.random.uniform(0.1, np.pi - 0.1, 100)
+        l_max, eps = 6, 1e-6
+        deriv = generate_real_sph_harms_deriv(l_max, theta, phi)
+        assert deriv.shape == (2, 49, 100)
+        d_phi = generate_real_sph_harms(l_max, theta, phi + eps)
+        d_phi -= generate_real_sph_harms(l_max, theta, phi - eps)
+        assert_allclose(deriv[0], d_phi / (2 * eps), atol=1e-7)
+        d_theta = generate_real_sph_harms(l_max, theta + eps, phi)
+        d_theta -= generate_real_sph_harms(l_max, theta - eps, phi)
+        assert_allclose(deriv[1], d_theta / (2 * eps) / np.sin(phi), atol=1e-7)
+        # finite on the poles
+        deriv = generate_real_sph_harms_deriv(l_max, np.zeros(2), np.array([0, np.pi]))
+        assert np.all(np.isfinite(deriv))
+        # analytic p functions
+        theta, phi = theta[:5], phi[:5]
+        ref = np.sqrt(3 / (4 * np.pi)) * np.array(
+            [
+                [
+                    -np.cos(phi) * np.sin(theta),
+                    -np.sin(phi),
+                    -np.cos(phi) * np.cos(theta),
+                ],
+                [-np.cos(theta), np.zeros(5), np.sin(theta)],
+            ]
+        )
+        assert_allclose(generate_real_sph_harms_deriv(1, theta, phi)[:, 1:], ref)
+
+    def test_eval_sph_harm_expansion(self):
+        """Test values, gradients and Laplacians of expansion with analytic ones."""
+        grid = generate_lebedev_grid(degree=21)
+        r = np.linspace(0.05, 4, 400)
+        # f = (z + x * y) exp(-r^2) projected on spherical harmonics
+        sph_points = r[:, None, None] * grid.points
+        x, y, z = sph_points[..., 0], sph_points[..., 1], sph_points[..., 2]
+        values = (z + x * y) * np.exp(-(r ** 2))[:, None]
+        theta = np.arctan2(grid.points[:, 1], grid.points[:, 0])
+        phi = np.arccos(grid.points[:, 2])
+        sph_h = generate_real_sph_harms(4, theta, phi)
+        spline = CubicSpline(r, values @ (sph_h * grid.weights).T)
+        points = np.random.uniform(-1.5, 1.5, (200, 3))
+        x, y, z = points.T
+        gauss = np.exp(-np.sum(points ** 2, axis=1))
+        poly = z + x * y
+        assert_allclose(
+            eval_sph_harm_expansion(spline, points), poly * gauss, atol=1e-6
+        )
+        grad = eval_sph_harm_expansion(spline, points, deriv=1)
+        ref = np.array([y, x, np.ones_like(z)]).T - 2 * points * poly[:, None]
+        assert_allclose(grad, ref * gauss[:, None], atol=1e-5)
+        lap = eval_sph_harm_expansion(spline, points, deriv=2)
+        # laplacian of P exp(-r^2) is (4 r^2 - 6 - 4 k) P exp(-r^2) for P of degree k
+        r_sq = np.sum(points ** 2, axis=1)
+        ref = ((4 * r_sq - 10) * z + (4 * r_sq - 14) * x * y) * gauss
+        assert_allclose(lap, ref, atol=1e-3)
+        # stack of functions
+        stack = CubicSpline(r, np.array([1, 2])[:, None] * spline(r)[:, None], axis=0)
+        grad_stack = eval_sph_harm_expansion(stack, points, deriv=1)
+        assert grad_stack.shape == (2, 200, 3)
+        assert_allclose(grad_stack[1], 2 * grad)
+        with self.assertRaises(ValueError):
+            eval_sph_harm_expansion(spline, points, deriv=3)
+
+    def test_eval_sph_harm_expansion_bytes(self):
+        """Test estimated scratch memory of expansion with traced allocations."""
+        r = np.linspace(0.1, 5, 30)
+        points = np.random.uniform(-3, 3, (5000, 3))
+        for l_max, shape in [(2, ()), (6, ()), (6, (3,))]:
+            n_sph_harms = (l_max + 1) ** 2
+            coeffs = np.random.normal(size=(30,) + shape + (n_sph_harms,))
+            spline = CubicSpline(r, coeffs)
+            for deriv in [0, 1, 2]:
+                tracemalloc.start()
+                try:
+                    eval_sph_harm_expansion(spline, points, deriv)
+                    peak = tracemalloc.get_traced_memory()[1]
+                finally:
+                    tracemalloc.stop()
+                n_funcs = int(np.prod(shape))
+                estimate = len(points) * eval_sph_harm_expansion_bytes(
+                    n_sph_harms, n_funcs, deriv
+                )
+                assert 0.5 * estimate < peak <= estimate
+
     def helper_func_power(self, points):
         """Compute function value for test interpolation."""
         return 2 * points[:, 0] ** 2 + 3 * points[:, 1] ** 2 + 4 * points[:, 2] ** 2
@@ -113,3 +257,49 @@ class TestInterpolate(TestCase):
                 assert_allclose(
                     interp[i], values[atgrid.indices[j - 1] : atgrid.indices[j]]
                 )
+
+    def test_spline_with_sph_harms_batch(self):
+        """Test decomposition of many functions at once."""
+        rad = HortonLinear(10)
+        rad._points += 1
+        atgrid = AtomicGrid(rad, 1, scales=[], degs=[7])
+        sph_coor = atgrid.convert_cart_to_sph()
+        values = np.array(
+            [
+                self.helper_func_power(atgrid.points),
+                atgrid.points[:, 0] * atgrid.points[:, 1],
+                np.ones(atgrid.size),
+            ]
+        )
+        r_sph = generate_real_sph_harms(3, sph_coor[:, 0], sph_coor[:, 1])
+        result = spline_with_sph_harms(
+            r_sph, values, atgrid.weights, atgrid.indices, rad.points
+        )
+        assert result(rad.points).shape == (10, 3, 16)
+        for i, value in enumerate(values):
+            ref = spline_with_sph_harms(
+                r_sph, value, atgrid.weights, atgrid.indices, rad.points
+            )
+            assert_allclose(result.c[..., i, :], ref.c, atol=1e-9)
+        semi_sph_c = sph_coor[atgrid.indices[5] : atgrid.indices[6]]
+        interp = interpelate(result, 6, semi_sph_c[:, 0], semi_sph_c[:, 1])
+        assert_allclose(
+            interp, values[:, atgrid.indices[5] : atgrid.indices[6]], atol=1e-12
+        )
+        interp = interpelate(result, [2, 6], semi_sph_c[:, 0], semi_sph_c[:, 1])
+        assert interp.shape == (2, 3, 26)
+        assert_allclose(
+            interp[0], values[:, atgrid.indices[1] : atgrid.indices[2]], atol=1e-12
+        )
+
+    def test_project_sph_harms(self):
+        """Test projection on spherical harmonics of shells of different sizes."""
+        projector = np.random.rand(4, 20)
+        values = np.random.rand(3, 20)
+        indices = [0, 3, 6, 10, 14, 18, 20]
+        table = project_sph_harms(projector, values, indices)
+        assert table.shape == (6, 3, 4)
+        for i in range(6):
+            shell = slice(indices[i], indices[i + 1])
+            assert_allclose(table[i], values[:, shell] @ projector[:, shell].T)
+        assert_allclose(project_sph_harms(projector, values[1], indices), table[:, 1])
@@ -23,11 +23,18 @@ from unittest import TestCase
 
 from grid.basegrid import AngularGrid
 from grid.lebedev import (
+    _generate_lebedev_arrays,
+    _load_orbits,
+    _orbit_ops,
     _select_grid_type,
+    _select_grid_types,
+    clear_lebedev_cache,
     generate_lebedev_grid,
+    lebedev_cache_info,
     match_degree,
     n_degree,
     n_points,
+    resize_lebedev_cache,
 )
 
 import numpy as np
@@ -59,6 +66,78 @@ class TestLebedev(TestCase):
                 assert_allclose(np.dot(grid.points[:, 2], grid.weights), 0, atol=1e-10)
             previous_npoint = npoint
 
+    def test_lebedev_cache(self):
+        """Test the lebedev grid cache."""
+        clear_lebedev_cache()
+        assert lebedev_cache_info() == (0, 0, len(n_degree), 0)
+        grid = generate_lebedev_grid(degree=7)
+        grid2 = generate_lebedev_grid(size=26)
+        assert grid2.points is grid.points
+        assert grid2.weights is grid.weights
+        assert not grid.points.flags.writeable
+        assert not grid.weights.flags.writeable
+        with self.assertRaises(ValueError):
+            grid.weights[0] = 1.0
+        assert lebedev_cache_info() == (1, 1, len(n_degree), 1)
+        # least recently used grids are removed
+        try:
+            resize_lebedev_cache(2)
+            for degree in [3, 5, 7, 9]:
+                generate_lebedev_grid(degree=degree)
+            info = lebedev_cache_info()
+            assert info.maxsize == 2 and info.currsize == 2
+            assert info.misses == 5 and info.hits == 1
+            generate_lebedev_grid(degree=7)
+            assert lebedev_cache_info().hits == 2
+            resize_lebedev_cache(0)
+            assert lebedev_cache_info().currsize == 0
+            grid3 = generate_lebedev_grid(degree=7)
+            assert_array_equal(grid3.weights, grid.weights)
+            assert lebedev_cache_info().currsize == 0
+            with self.assertRaises(ValueError):
+                resize_lebedev_cache(-1)
+        finally:
+            resize_lebedev_cache(len(n_degree))
+        clear_lebedev_cache()
+        assert lebedev_cache_info() == (0, 0, len(n_degree), 0)
+
+    def test_lebedev_orbits(self):
+        """Test lebedev grids generated from orbit generators."""
+        orbits = _load_orbits()
+        assert orbits.shape[1] == 6
+        assert not orbits.flags.writeable
+        # the table is memory-mapped and loaded once
+        assert isinstance(orbits.base, np.memmap)
+        assert _load_orbits() is orbits
+        for index, (degree, size) in enumerate(zip(n_degree, n_points)):
+            points, weights = _generate_lebedev_arrays(degree, size)
+            assert points.shape == (size, 3) and weights.shape == (size,)
+            assert_allclose(np.linalg.norm(points, axis=1), 1.0)
+            assert_allclose(np.sum(weights), 4 * np.pi)
+            # all points are distinct and without negative zeros
+            assert len(np.unique(np.round(points, 12), axis=0)) == size
+            assert not np.any(np.signbit(points) & (points == 0))
+            # orbit points are images of the generator with the same weight
+            rows = orbits[orbits[:, 0] == index]
+            start = 0
+            for orbit_type in range(1, 7):
+                generators = rows[rows[:, 1] == orbit_type]
+                for i, generator in enumerate(generators):
+                    block = slice(start + i, None, len(generators))
+                    n_ops = len(_orbit_ops[orbit_type][0])
+                    orbit = points[block][:n_ops]
+                    assert_allclose(
+                        np.sort(np.abs(orbit), axis=1),
+                        np.tile(np.sort(np.abs(generator[2:5])), (n_ops, 1)),
+                    )
+                    assert_allclose(weights[block][:n_ops], generator[5] * 4 * np.pi)
+                start += len(generators) * len(_orbit_ops[orbit_type][0])
+        # each orbit type has distinct signed permutations of its generator
+        generator = np.array([0.3, 0.5, np.sqrt(0.66)])
+        for perms, signs in _orbit_ops.values():
+            images = signs * generator[perms]
+            assert len(np.unique(images, axis=0)) == len(perms)
+
     def test_match_degree(self):
         """Test match proper degree for random given values."""
         # test array 1
@@ -71,6 +150,34 @@ class TestLebedev(TestCase):
         result2 = match_degree(num_list2)
         assert_array_equal(result2, [35, 35, 35, 41, 41, 41, 41, 41])
 
+    def test_select_grid_types(self):
+        """Test batched grid type selection with scalar selection."""
+        degrees, sizes = _select_grid_types(degrees=np.arange(1, 132))
+        for i, (degree, size) in enumerate(zip(degrees, sizes)):
+            assert (degree, size) == _select_grid_type(degree=i + 1)
+        degrees, sizes = _select_grid_types(sizes=np.arange(1, 5811))
+        for i, (degree, size) in enumerate(zip(degrees, sizes)):
+            assert (degree, size) == _select_grid_type(size=i + 1)
+        degrees, sizes = _select_grid_types(degrees=[])
+        assert degrees.size == 0 and sizes.size == 0
+        assert_array_equal(
+            match_degree(np.array([[3, 4], [131, 1]])), [[3, 5], [131, 3]]
+        )
+        with self.assertRaises(ValueError):
+            _select_grid_types()
+        with self.assertRaises(ValueError):
+            _select_grid_types(degrees=[3, 0])
+        with self.assertRaises(ValueError):
+            _select_grid_types(degrees=[3, 132])
+        with self.assertRaises(ValueError):
+            _select_grid_types(sizes=[-1])
+        with self.assertRaises(ValueError):
+            _select_grid_types(sizes=[5811])
+        with self.assertRaises(ValueError):
+            match_degree([5, -2])
+        with self.assertWarns(RuntimeWarning):
+            _select_grid_types(degrees=[5], sizes=[10])
+
     def test_errors_and_warnings(self):
         """Tests for errors and warning."""
         # low level function tests
@@ -17,7 +17,10 @@
 # You should have received a copy of the GNU General Public License
 # along with this program; if not, see <http://www.gnu.org/licenses/>
 """MolGrid test file."""
-from unittest import TestCase
+
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase, mock, skipIf
 
 from grid.atomic_grid import AtomicGrid
 from grid.basegrid import OneDGrid, SimpleAtomicGrid
@@ -27,7 +30,7 @@ from grid.rtransform import ExpRTransform
 
 # from importlib_resources import path
 import numpy as np
-from numpy.testing import assert_allclose, assert_almost_equal
+from numpy.testing import assert_allclose, assert_almost_equal, assert_array_equal
 
 
 class TestMolGrid(TestCase):
@@ -137,6 +140,269 @@ class TestMolGrid(TestCase):
             numbers[1] -= 1
     """
 
+    def test_integrate_ssf_hydrogen_trimer_1s(self):
+        """Test molecular integral in H3 with ssf aim_weights."""
+        coordinates = np.array(
+            [[0.0, 0.0, -0.5], [0.0, 0.0, 0.5], [0.0, 0.5, 0.0]], float
+        )
+        atgs = [
+            AtomicGrid(
+                self.rgrid, 0.5, scales=np.array([]), degs=np.array([17]), center=c
+            )
+            for c in coordinates
+        ]
+        mg = MolGrid(atgs, np.array([0.5, 0.5, 0.5]), aim_weights="ssf")
+        fn = 0
+        for coor in coordinates:
+            fn += np.exp(-2 * np.linalg.norm(mg.points - coor, axis=-1)) / np.pi
+        occupation = mg.integrate(fn)
+        assert_almost_equal(occupation, 3.0, decimal=4)
+
+    def test_integrate_hirshfeld_hydrogen_trimer_1s(self):
+        """Test molecular integral in H3 with hirshfeld aim_weights."""
+        coordinates = np.array(
+            [[0.0, 0.0, -0.5], [0.0, 0.0, 0.5], [0.0, 0.5, 0.0]], float
+        )
+        atgs = [
+            AtomicGrid(
+                self.rgrid, 0.5, scales=np.array([]), degs=np.array([17]), center=c
+            )
+            for c in coordinates
+        ]
+        r = np.linspace(0, 20, 401)
+        proatom = (r, np.exp(-2 * r) / np.pi)
+        mg = MolGrid(
+            atgs,
+            np.array([0.5, 0.5, 0.5]),
+            aim_weights="hirshfeld",
+            proatoms=[proatom] * 3,
+            n_workers=2,
+        )
+        fn = 0
+        for coor in coordinates:
+            fn += np.exp(-2 * np.linalg.norm(mg.points - coor, axis=-1)) / np.pi
+        occupation = mg.integrate(fn)
+        assert_almost_equal(occupation, 3.0, decimal=4)
+        assert mg.aim_info is None
+        # hirshfeld weights follow the atoms
+        new_coors = coordinates + np.random.uniform(-0.1, 0.1, (3, 3))
+        mg.update_coordinates(new_coors)
+        for atg, coor in zip(atgs, new_coors):
+            atg.center = coor
+        ref = MolGrid(
+            atgs,
+            np.array([0.5, 0.5, 0.5]),
+            aim_weights="hirshfeld",
+            proatoms=[proatom] * 3,
+        )
+        assert_allclose(mg.aim_weights, ref.aim_weights, atol=1e-12)
+
+    def test_integrate_hirshfeld_i_hydrogen_pair(self):
+        """Test iterative hirshfeld populations of H2 with charge transfer."""
+        coordinates = np.array([[0.0, 0.0, -0.7], [0.0, 0.0, 0.7]], float)
+        atgs = [
+            AtomicGrid(
+                self.rgrid, 0.5, scales=np.array([]), degs=np.array([17]), center=c
+            )
+            for c in coordinates
+        ]
+        r = np.linspace(0, 20, 401)
+        rhos = np.array(
+            [
+                np.zeros_like(r),
+                np.exp(-2 * r) / np.pi,
+                2 * 1.5 ** 3 * np.exp(-3 * r) / np.pi,
+            ]
+        )
+        proatom = (r, rhos, np.array([0.0, 1.0, 2.0]))
+        # density of pro-atoms with populations 1.2 and 0.8
+        points = np.concatenate([atg.points for atg in atgs])
+        dists = np.linalg.norm(points - coordinates[:, None], axis=-1)
+        density = 0.8 * np.exp(-2 * dists[0]) / np.pi
+        density += 0.2 * 2 * 1.5 ** 3 * np.exp(-3 * dists[0]) / np.pi
+        density += 0.8 * np.exp(-2 * dists[1]) / np.pi
+        mg = MolGrid(
+            atgs,
+            np.array([0.5, 0.5]),
+            aim_weights="hirshfeld-i",
+            proatoms=[proatom] * 2,
+            density=density,
+        )
+        assert mg.aim_info["converged"]
+        assert mg.aim_info["n_iter"] > 1
+        assert_allclose(mg.aim_info["populations"], [1.2, 0.8], atol=1e-4)
+        assert_almost_equal(mg.integrate(density), 2.0, decimal=4)
+        with self.assertRaises(NotImplementedError):
+            mg.update_coordinates(coordinates)
+
+    def test_integrate_aim_weights_deriv(self):
+        """Test aim weights derivative of integral with finite difference."""
+        coordinates = np.array([[0.0, 0.0, -0.7], [0.0, 0.1, 0.7], [0.8, 0.0, 0.0]])
+        radii = np.array([0.5, 0.9, 0.7])
+        rgrid = OneDGrid(self.rgrid.points[::5], self.rgrid.weights[::5] * 5)
+
+        def molgrid(coors):
+            atgs = [
+                AtomicGrid(
+                    rgrid, 0.5, scales=np.array([]), degs=np.array([11]), center=c
+                )
+                for c in coors
+            ]
+            return MolGrid(atgs, radii)
+
+        mg = molgrid(coordinates)
+        fn = np.exp(-1.5 * np.linalg.norm(mg.points - coordinates[0], axis=1) ** 2)
+        deriv = mg.integrate_aim_weights_deriv(fn)
+        step = 1e-5
+        for i in range(3):
+            for j in range(3):
+                shift = np.zeros((3, 3))
+                shift[i, j] = step
+                aim_p = molgrid(coordinates + shift).aim_weights
+                aim_m = molgrid(coordinates - shift).aim_weights
+                ref = np.sum(mg.weights * fn * (aim_p - aim_m)) / step / 2
+                assert_allclose(deriv[i, j], ref, atol=1e-7)
+        atgs = [
+            AtomicGrid(rgrid, 0.5, scales=np.array([]), degs=np.array([11]), center=c)
+            for c in coordinates
+        ]
+        with self.assertRaises(NotImplementedError):
+            MolGrid(atgs, radii, aim_weights="ssf").integrate_aim_weights_deriv(fn)
+        with self.assertRaises(ValueError):
+            mg.integrate_aim_weights_deriv()
+        with self.assertRaises(TypeError):
+            mg.integrate_aim_weights_deriv(1)
+        with self.assertRaises(ValueError):
+            mg.integrate_aim_weights_deriv(np.array([3, 5]))
+
+    def test_molgrid_max_memory(self):
+        """Test aim_weights do not depend on the memory budget."""
+        coordinates = np.array(
+            [[0.0, 0.0, -0.5], [0.0, 0.0, 0.5], [0.0, 0.5, 0.0]], float
+        )
+        atgs = [
+            AtomicGrid(
+                self.rgrid, 0.5, scales=np.array([]), degs=np.array([17]), center=c
+            )
+            for c in coordinates
+        ]
+        radii = np.array([0.5, 0.5, 0.5])
+        ref = MolGrid(atgs, radii, max_memory=None)
+        for max_memory in [1, 10 ** 5, 10 ** 7]:
+            mg = MolGrid(atgs, radii, max_memory=max_memory)
+            assert_array_equal(mg.aim_weights, ref.aim_weights)
+
+    @skipIf(sys.version_info < (3, 8), "shared memory needs python >= 3.8")
+    def test_molgrid_n_workers(self):
+        """Test aim_weights computed in a process pool."""
+        coordinates = np.array(
+            [[0.0, 0.0, -0.5], [0.0, 0.0, 0.5], [0.0, 0.5, 0.0]], float
+        )
+        atgs = [
+            AtomicGrid(
+                self.rgrid, 0.5, scales=np.array([]), degs=np.array([17]), center=c
+            )
+            for c in coordinates
+        ]
+        radii = np.array([0.5, 0.6, 0.7])
+        for aim_weights in ["becke", "ssf"]:
+            ref = MolGrid(atgs, radii, aim_weights=aim_weights)
+            mg = MolGrid(atgs, radii, aim_weights=aim_weights, n_workers=2)
+            assert_array_equal(mg.aim_weights, ref.aim_weights)
+
+    def test_molgrid_executor(self):
+        """Test aim_weights computed with a given executor."""
+        coordinates = np.array(
+            [[0.0, 0.0, -0.5], [0.0, 0.0, 0.5], [0.0, 0.5, 0.0]], float
+        )
+        atgs = [
+            AtomicGrid(
+                self.rgrid, 0.5, scales=np.array([]), degs=np.array([17]), center=c
+            )
+            for c in coordinates
+        ]
+        radii = np.array([0.5, 0.6, 0.7])
+        ref = MolGrid(atgs, radii)
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            mg = MolGrid(atgs, radii, executor=executor)
+            assert_array_equal(mg.aim_weights, ref.aim_weights)
+            # sectors are pickled without shared memory
+            with mock.patch("grid.molgrid._HAS_SHARED_MEMORY", False):
+                mg = MolGrid(atgs, radii, aim_weights="ssf", executor=executor)
+                mg.update_coordinates(coordinates + 0.1)
+            ref = MolGrid(atgs, radii, aim_weights="ssf")
+            ref.update_coordinates(coordinates + 0.1)
+            assert_array_equal(mg.aim_weights, ref.aim_weights)
+
+    def test_molgrid_screen_tol(self):
+        """Test becke aim_weights with screening of distant atoms."""
+        coordinates = np.array([[0.0, 0.0, 3.0 * i] for i in range(4)])
+        atgs = [
+            AtomicGrid(
+                self.rgrid, 0.5, scales=np.array([]), degs=np.array([17]), center=c
+            )
+            for c in coordinates
+        ]
+        radii = np.array([0.5, 0.6, 0.7, 0.5])
+        ref = MolGrid(atgs, radii)
+        mg = MolGrid(atgs, radii, screen_tol=1e-12)
+        assert_allclose(mg.aim_weights, ref.aim_weights, atol=1e-10)
+        # a loose tolerance changes the weights, so screening is used
+        mg = MolGrid(atgs, radii, screen_tol=1e-3)
+        assert not np.allclose(mg.aim_weights, ref.aim_weights, rtol=0, atol=1e-8)
+        assert_allclose(mg.aim_weights, ref.aim_weights, atol=1e-1)
+        # screening is passed to the workers
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            for shared in [True, False]:
+                with mock.patch("grid.molgrid._HAS_SHARED_MEMORY", shared):
+                    mg2 = MolGrid(atgs, radii, executor=executor, screen_tol=1e-3)
+                assert_array_equal(mg2.aim_weights, mg.aim_weights)
+
+    def test_update_coordinates(self):
+        """Test moving molgrid to new atomic coordinates."""
+        coordinates = np.array([[0.0, 0.0, -0.5], [0.0, 0.0, 0.5], [0.0, 0.5, 0.0]])
+        radii = np.array([0.5, 0.6, 0.7])
+
+        def atomic_grids(coors):
+            return [
+                AtomicGrid(
+                    self.rgrid, 0.5, scales=np.array([]), degs=np.array([17]), center=c
+                )
+                for c in coors
+            ]
+
+        new_coors = coordinates + np.random.uniform(-0.1, 0.1, (3, 3))
+        for aim_weights in ["becke", "ssf"]:
+            mg = MolGrid(atomic_grids(coordinates), radii, aim_weights=aim_weights)
+            atoms = mg.update_coordinates(new_coors)
+            assert_array_equal(atoms, [0, 1, 2])
+            ref = MolGrid(atomic_grids(new_coors), radii, aim_weights=aim_weights)
+            assert_allclose(mg.points, ref.points)
+            assert_allclose(mg.aim_weights, ref.aim_weights, atol=1e-12)
+        # rigid translation does not change aim_weights
+        atgs = atomic_grids(coordinates)
+        mg = MolGrid(atgs, radii, store=True)
+        aim_weights = mg.aim_weights.copy()
+        atoms = mg.update_coordinates(coordinates + 1.0, tol=0.0)
+        assert len(atoms) == 0
+        assert_allclose(mg.aim_weights, aim_weights)
+        assert_allclose(mg[1].points, atomic_grids(coordinates + 1.0)[1].points)
+        # given atomic grids are not moved
+        for atg, coor in zip(atgs, coordinates):
+            assert_array_equal(atg.center, coor)
+        # only atoms close to the moved atom are updated
+        new_coors = coordinates.copy()
+        new_coors[2] = [0.0, 5.5, 0.0]
+        mg = MolGrid(atomic_grids(new_coors), radii)
+        new_coors[1] += 0.01
+        atoms = mg.update_coordinates(new_coors, tol=1e-3, cutoff=3.0)
+        assert_array_equal(atoms, [0, 1])
+        with self.assertRaises(ValueError):
+            mg.update_coordinates(new_coors[:2])
+        mg = MolGrid(atomic_grids(coordinates), radii, aim_weights=np.ones(mg.size))
+        with self.assertRaises(NotImplementedError):
+            mg.update_coordinates(coordinates)
+
     def test_molgrid_attrs_subgrid(self):
         """Test sub atomic grid attributes."""
         # numbers = np.array([6, 8], int)
@@ -178,6 +444,11 @@ class TestMolGrid(TestCase):
             atgrid = mg[i]
             assert isinstance(atgrid, SimpleAtomicGrid)
             assert_allclose(atgrid.center, mg._coors[i])
+        # simple atomic grids of a molecular grid make a new molecular grid
+        mg2 = MolGrid([mg[0], mg[1]], np.array([1.228, 0.945]))
+        assert_allclose(mg2.points, mg.points)
+        assert_allclose(mg2.weights, mg.weights * mg.aim_weights)
+        assert_allclose(mg2._coors, mg._coors)
 
     def test_molgrid_attrs(self):
         """Test MolGrid attributes."""
@@ -232,6 +503,84 @@ class TestMolGrid(TestCase):
         occupation = mg.integrate(fn)
         assert_almost_equal(occupation, 4.0, decimal=4)
 
+    def test_interpolate(self):
+        """Test interpolation of functions at arbitrary points."""
+        coors = np.array([[0.0, 0.0, -0.7], [0.0, 0.0, 0.7]])
+        atgrids = [
+            AtomicGrid(self.rgrid, 0.5, scales=[], degs=[29], center=center)
+            for center in coors
+        ]
+        # translated points read before are not kept alive without store
+        moved = atgrids[0].points
+        mg = MolGrid(atgrids, np.array([0.5, 0.5]), max_memory=2 ** 16)
+        assert mg._atomic_grids[0]._moved_points is None
+        assert mg._atomic_grids[0]._points is atgrids[0]._points
+        assert atgrids[0].points is moved
+        assert MolGrid(atgrids, np.array([0.5, 0.5]), store=True)[0] is atgrids[0]
+
+        def func(points):
+            dists = np.linalg.norm(points[:, None] - coors, axis=-1)
+            return np.exp(-(dists[:, 0] ** 2)) + 0.5 * np.exp(-2 * dists[:, 1] ** 2)
+
+        values = func(mg.points)
+        splines = mg.spline_with_sph_harms(np.array([values, 2 * values]))
+        assert len(splines) == 2
+        assert splines[0].c.shape[-2:] == (2, 225)
+        points = np.random.uniform(-2, 2, (3000, 3))
+        result = mg.interpolate(splines, points)
+        assert result.shape == (2, 3000)
+        assert_allclose(result[0], func(points), atol=5e-3)
+        assert_allclose(result[1], 2 * result[0])
+        grad = mg.interpolate(splines, points, deriv=1)
+        assert grad.shape == (2, 3000, 3)
+        assert_allclose(grad[1], 2 * grad[0])
+        assert mg.interpolate(splines, points, deriv=2).shape == (2, 3000)
+        # same result in blocks and for single function
+        splines = mg.spline_with_sph_harms(values, l_max=8)
+        result = mg.interpolate(splines, points, chunk_size=700)
+        assert_allclose(result, mg.interpolate(splines, points, chunk_size=3000))
+        grad = mg.interpolate(splines, points, chunk_size=700, deriv=1)
+        assert_allclose(grad, mg.interpolate(splines, points, deriv=1))
+        # no contribution beyond the cutoffs
+        far = np.array([[0.0, 0.0, 3.0], [0.0, 0.0, -3.0], [0.0, 0.0, 40.0]])
+        result = mg.interpolate(splines, far, cutoffs=[2.0, 2.2])
+        assert_allclose(result, 0)
+        result = mg.interpolate(splines, far, cutoffs=3.0)
+        assert_allclose(result[:2], func(far[:2]), atol=1e-3)
+        assert result[2] == 0
+        with self.assertRaises(ValueError):
+            mg.spline_with_sph_harms(values[:-1])
+        with self.assertRaises(ValueError):
+            mg.interpolate(splines[:1], points)
+        with self.assertRaises(ValueError):
+            mg.interpolate(splines, points, deriv=3)
+
+    def test_interpolate_derivs(self):
+        """Test interpolated gradients and laplacians with analytic ones."""
+        pts = HortonLinear(200)
+        tf = ExpRTransform(1e-3, 1e1)
+        rgrid = OneDGrid(tf.transform(pts.points), tf.deriv(pts.points) * pts.weights)
+        coors = np.array([[0.0, 0.0, -0.7], [0.0, 0.0, 0.7]])
+        atgrids = [
+            AtomicGrid(rgrid, 0.5, scales=[], degs=[29], center=center)
+            for center in coors
+        ]
+        mg = MolGrid(atgrids, np.array([0.5, 0.5]))
+        # sum of gaussians exp(-a d^2) with exponents 1 and 2
+        alphas, coeffs = np.array([1.0, 2.0]), np.array([1.0, 0.5])
+        dists = np.sum((mg.points[:, None] - coors) ** 2, axis=-1)
+        splines = mg.spline_with_sph_harms(np.exp(-dists * alphas) @ coeffs)
+        # fixed points, as about 1 in 10^5 random points near the bond axis
+        # between the atoms exceeds the Laplacian tolerance
+        points = np.random.RandomState(0).uniform(-2, 2, (1000, 3))
+        diff = points[:, None] - coors
+        dists = np.sum(diff ** 2, axis=-1)
+        gauss = np.exp(-dists * alphas) * coeffs
+        ref = -2 * np.einsum("pa,a,pax->px", gauss, alphas, diff)
+        assert_allclose(mg.interpolate(splines, points, deriv=1), ref, atol=3e-3)
+        ref = np.sum(gauss * (4 * alphas ** 2 * dists - 6 * alphas), axis=1)
+        assert_allclose(mg.interpolate(splines, points, deriv=2), ref, atol=5e-2)
+
     def test_raise_errors(self):
         """Test molgrid errors raise."""
         atg = AtomicGrid(
@@ -248,6 +597,23 @@ class TestMolGrid(TestCase):
             MolGrid([atg], np.array([1.0]), aim_weights=np.array(3))
         with self.assertRaises(TypeError):
             MolGrid([atg], np.array([1.0]), aim_weights=[3, 5])
+        r = np.linspace(0, 10, 11)
+        with self.assertRaises(ValueError):
+            MolGrid([atg], np.array([1.0]), aim_weights="hirshfeld")
+        with self.assertRaises(ValueError):
+            MolGrid(
+                [atg],
+                np.array([1.0]),
+                aim_weights="hirshfeld",
+                proatoms=[(r, np.exp(-r))] * 2,
+            )
+        with self.assertRaises(ValueError):
+            MolGrid(
+                [atg],
+                np.array([1.0]),
+                aim_weights="hirshfeld-i",
+                proatoms=[(r, np.exp(-r)[None], np.array([1.0]))],
+            )
         # integrate errors
         molg = MolGrid([atg], np.array([1.0]))
         with self.assertRaises(ValueError):
@@ -1,7 +1,7 @@
 """Utils function test file."""
 from unittest import TestCase
 
-from grid.utils import get_cov_radii
+from grid.utils import LRUCache, get_chunk_size, get_cov_radii
 
 import numpy as np
 from numpy.testing import assert_allclose
@@ -48,3 +48,53 @@ class TestUtils(TestCase):
             get_cov_radii(0)
         with self.assertRaises(ValueError):
             get_cov_radii([3, 5, 0])
+
+    def test_get_chunk_size(self):
+        """Test number of points in each block."""
+        assert get_chunk_size(300, 80) == 300
+        assert get_chunk_size(0, 80) == 1
+        assert get_chunk_size(300, 80, chunk_size=5) == 5
+        assert get_chunk_size(300, 80, max_memory=800) == 10
+        assert get_chunk_size(300, 80, max_memory=10) == 1
+        with self.assertRaises(ValueError):
+            get_chunk_size(300, 80, chunk_size=0)
+        with self.assertRaises(ValueError):
+            get_chunk_size(300, 80, max_memory=-1)
+
+    def test_lru_cache(self):
+        """Test least recently used cache and its statistics."""
+        cache = LRUCache(maxsize=2)
+        calls = []
+
+        def compute(key):
+            calls.append(key)
+            return key * 2
+
+        assert cache.get(1, lambda: compute(1)) == 2
+        assert cache.get(1, lambda: compute(1)) == 2
+        assert calls == [1]
+        assert cache.info() == (1, 1, 2, 1)
+        # least recently used key 2 is removed, not key 1
+        cache.get(2, lambda: compute(2))
+        cache.get(1, lambda: compute(1))
+        cache.get(3, lambda: compute(3))
+        cache.get(1, lambda: compute(1))
+        assert calls == [1, 2, 3]
+        cache.get(2, lambda: compute(2))
+        assert calls == [1, 2, 3, 2]
+        assert cache.info() == (3, 4, 2, 2)
+        cache.resize(1)
+        assert cache.info().currsize == 1
+        cache.resize(0)
+        cache.get(4, lambda: compute(4))
+        assert cache.info().currsize == 0
+        cache.resize(None)
+        for key in range(10):
+            cache.get(key, lambda: compute(key))
+        assert cache.info().currsize == 10
+        cache.clear()
+        assert cache.info() == (0, 0, None, 0)
+        with self.assertRaises(ValueError):
+            cache.resize(-1)
+        with self.assertRaises(ValueError):
+            LRUCache(maxsize=-1)
@@ -1,6 +1,11 @@
 """Utils function module."""
+import threading
+from collections import OrderedDict, namedtuple
+
 import numpy as np
 
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
 _bragg = np.array(
     [
         np.nan,  # index 0, place holder
@@ -219,3 +224,138 @@ def get_cov_radii(numbers, type="bragg"):
         return _cambridge[numbers]
     else:
         raise ValueError(f"Not supported radii type, got {type}")
+
+
+def get_chunk_size(n_points, point_bytes, chunk_size=None, max_memory=None):
+    """Compute the number of points processed in each block.
+
+    Parameters
+    ----------
+    n_points : int
+        Total number of points to be processed
+    point_bytes : int
+        Scratch memory (in bytes) needed for each point in a block
+    chunk_size : int, optional
+        Preferred number of points in each block. If given, max_memory is
+        ignored.
+    max_memory : int, optional
+        Upper bound (in bytes) of the scratch memory used for each block. If
+        neither chunk_size nor max_memory is given, all points are processed
+        in one block.
+
+    Returns
+    -------
+    int
+        Number of points in each block, at least 1
+
+    Raises
+    ------
+    ValueError
+        chunk_size or max_memory is not positive
+    """
+    if chunk_size is not None:
+        if chunk_size <= 0:
+            raise ValueError(f"chunk_size need to be positive, got {chunk_size}")
+        return int(chunk_size)
+    if max_memory is not None:
+        if max_memory <= 0:
+            raise ValueError(f"max_memory need to be positive, got {max_memory}")
+        return int(max(max_memory // max(point_bytes, 1), 1))
+    return max(n_points, 1)
+
+
+class LRUCache:
+    """Thread-safe least recently used cache with hit and miss statistics."""
+
+    def __init__(self, maxsize=128):
+        """Construct an empty cache.
+
+        Parameters
+        ----------
+        maxsize : int or None, default to 128
+            Largest number of cached values. If None, the cache is unbounded,
+            if 0, no value is cached.
+        """
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = self._misses = 0
+        self._maxsize = None
+        self.resize(maxsize)
+
+    def get(self, key, compute):
+        """Get the cached value of key, computing and storing it on a miss.
+
+        compute is called without holding the lock, so concurrent misses of
+        the same key may compute the value more than once.
+
+        Parameters
+        ----------
+        key : hashable
+            Key of the value
+        compute : callable
+            Function without arguments returning the value of key
+
+        Returns
+        -------
+        object
+            Cached or newly computed value of key
+        """
+        with self._lock:
+            if key in self._data:
+                self._hits += 1
+                self._data.move_to_end(key)
+                return self._data[key]
+            self._misses += 1
+        value = compute()
+        with self._lock:
+            if self._maxsize is None or self._maxsize > 0:
+                self._data[key] = value
+                self._data.move_to_end(key)
+                self._evict()
+        return value
+
+    def info(self):
+        """Get statistics of the cache.
+
+        Returns
+        -------
+        CacheInfo
+            Named tuple of hits, misses, maxsize and currsize of the cache
+        """
+        with self._lock:
+            return CacheInfo(self._hits, self._misses, self._maxsize, len(self._data))
+
+    def clear(self):
+        """Remove all values from the cache and reset its statistics."""
+        with self._lock:
+            self._data.clear()
+            self._hits = self._misses = 0
+
+    def resize(self, maxsize):
+        """Set the largest number of values kept in the cache.
+
+        Least recently used values beyond maxsize are removed.
+
+        Parameters
+        ----------
+        maxsize : int or None
+            Largest number of cached values. If None, the cache is unbounded,
+            if 0, no value is cached.
+
+        Raises
+        ------
+        ValueError
+            maxsize is negative
+        """
+        if maxsize is not None and maxsize < 0:
+            raise ValueError(
+                f"maxsize needs to be a non-negative integer, got {maxsize}"
+            )
+        with self._lock:
+            self._maxsize = maxsize
+            self._evict()
+
+    def _evict(self):
+        """Remove least recently used values beyond maxsize, lock held."""
+        while self._maxsize is not None and len(self._data) > self._maxsize:
+            self._data.popitem(last=False)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# GRID is a numerical integration library for quantum chemistry.
+#
+# Copyright (C) 2011-2019 The GRID Development Team
+#
+# This file is part of GRID.
+#
+# GRID is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# GRID is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+"""Extract the orbit generators of the lebedev_*.npz files into lebedev_orbits.npy.
+
+Each row of the table is [grid index in grid.lebedev.n_degree, orbit type,
+generator x, y, z, weight]. Orbit types are those of the Lebedev-Laikov rules:
+1 (a1), 2 (a2), 3 (a3), 4 (bk), 5 (ck) and 6 (dk). All orbits of one type are
+stored together with their points interleaved, i.e. the points of a type are
+ordered by symmetry operation first and generator second. The table is checked
+to reproduce all points and weights exactly.
+
+lebedev_orbits.npy is the source of truth for the shipped grids and the .npz
+files are no longer kept in the repository. To add or regenerate rules, check
+out the .npz files (e.g. from the history of src/grid/data/lebedev) into a
+directory and run from the root of the repository, with grid importable::
+
+    python tools/make_lebedev_orbits.py <directory of lebedev_*.npz files>
+"""
+
+import os
+import sys
+
+import numpy as np
+
+DATA_DIR = os.path.join("src", "grid", "data", "lebedev")
+
+
+def orbit_type(generator):
+    """Classify the octahedral orbit of a point on the unit sphere."""
+    a, b, c = np.sort(np.abs(generator))
+    if a == b == 0:
+        return 1
+    if a == 0:
+        return 2 if b == c else 5
+    if a == c:
+        return 3
+    return 4 if a == b or b == c else 6
+
+
+def main(npz_dir):
+    """Write the lebedev orbit table from the .npz files in npz_dir."""
+    from grid.lebedev import _generate_lebedev_arrays, _orbit_ops, n_degree, n_points
+    import grid.lebedev
+
+    table = []
+    for index, (degree, size) in enumerate(zip(n_degree, n_points)):
+        data = np.load(os.path.join(npz_dir, f"lebedev_{degree}_{size}.npz"))
+        points, weights = data["points"], data["weights"]
+        start = 0
+        while start < size:
+            kind = orbit_type(points[start])
+            n_ops = len(_orbit_ops[kind][0])
+            # generators of one type are followed by their symmetry images
+            key = np.sort(np.abs(points[start]))
+            n_gen = 1
+            while start + n_gen < size and not np.array_equal(
+                np.sort(np.abs(points[start + n_gen])), key
+            ):
+                n_gen += 1
+            n_gen = min(n_gen, (size - start) // n_ops)
+            for point, weight in zip(
+                points[start : start + n_gen], weights[start : start + n_gen]
+            ):
+                table.append([index, kind, *point, weight])
+            start += n_ops * n_gen
+    table = np.array(table)
+    # check generated grids against the original points and weights
+    grid.lebedev._orbits = table
+    for degree, size in zip(n_degree, n_points):
+        data = np.load(os.path.join(npz_dir, f"lebedev_{degree}_{size}.npz"))
+        points, weights = _generate_lebedev_arrays(degree, size)
+        if not (
+            np.array_equal(points.view(np.int64), data["points"].view(np.int64))
+            and np.array_equal(weights, data["weights"] * 4 * np.pi)
+        ):
+            raise ValueError(f"Orbits of degree {degree} do not reproduce the grid.")
+    np.save(os.path.join(DATA_DIR, "lebedev_orbits.npy"), table)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.exit(f"usage: {sys.argv[0]} <directory of lebedev_*.npz files>")
+    main(sys.argv[1])